@@ -0,0 +1,93 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+
+from api.snapshots import VersionedSnapshot
+from recipes.models import Ingredient
+
+# Символы, после которых совпадение считается началом слова.
+WORD_SEPARATORS = frozenset(' -(,.«"/')
+# Короче этого поиск по вхождению совпадает с большей частью
+# справочника и не помогает автодополнению.
+CONTAINS_MIN_LENGTH = 3
+
+
+class IngredientIndex:
+    """Поиск ингредиентов по началу названия без обращения к БД.
+
+    Строки хранятся в порядке выдачи API (по name), ключи — отсортированные
+    casefold-названия со ссылкой на номер строки. Префиксный поиск — два
+    bisect по ключам. Поиск по вхождению идёт по склеенной строке всех
+    названий через str.find, то есть в C, а не в цикле Python.
+    """
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        folded = [name.casefold() for _, name, _ in self.rows]
+        order = sorted(range(len(folded)), key=folded.__getitem__)
+        self.keys = [folded[position] for position in order]
+        self.positions = array('l', order)
+        self.blob = '\n'.join(folded)
+        self.offsets = array('l')
+        offset = 0
+        for name in folded:
+            self.offsets.append(offset)
+            offset += len(name) + 1
+
+    def startswith(self, prefix):
+        low = bisect_left(self.keys, prefix)
+        high = bisect_right(self.keys, prefix + '\U0010ffff', low)
+        return sorted(self.positions[low:high])
+
+    def contains(self, needle, limit):
+        """Номера строк, где needle встречается не в начале названия.
+
+        Ранжирование: сначала совпадения с начала слова, затем по
+        позиции вхождения, длине названия и порядку выдачи.
+        """
+        blob, offsets = self.blob, self.offsets
+        candidates = []
+        start = blob.find(needle)
+        while start != -1:
+            position = bisect_right(offsets, start) - 1
+            row_start = offsets[position]
+            column = start - row_start
+            if column:
+                word_start = blob[start - 1] in WORD_SEPARATORS
+                length = len(self.rows[position][1])
+                candidates.append(
+                    (not word_start, column, length, position)
+                )
+            if position + 1 == len(offsets):
+                break
+            start = blob.find(needle, offsets[position + 1])
+        return [
+            candidate[-1]
+            for candidate in heapq.nsmallest(limit, candidates)
+        ]
+
+    def search(self, query, contains_limit=0):
+        query = query.replace('\n', ' ').casefold()
+        positions = self.startswith(query)
+        if contains_limit and len(query) >= CONTAINS_MIN_LENGTH:
+            positions += self.contains(query, contains_limit)
+        return [self.to_representation(position) for position in positions]
+
+    def to_representation(self, position):
+        # Повторяет IngredientSerializer.
+        ingredient_id, name, measurement_unit = self.rows[position]
+        return {
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+        }
+
+
+class IngredientIndexSnapshot(VersionedSnapshot):
+    def build(self):
+        return IngredientIndex(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        )
+
+
+ingredient_index = IngredientIndexSnapshot('ingredients')
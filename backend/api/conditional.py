@@ -0,0 +1,96 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+from rest_framework.generics import get_object_or_404
+
+from api.membership import get_membership, membership_version
+from api.snapshots import accepts_gzip, request_versions
+
+
+def get_validators(request, resources, personalized):
+    """ETag и Last-Modified без обращения к данным ответа.
+
+    В персональный ETag входит версия наборов пользователя, а
+    Last-Modified для него не отдаётся: время изменения этих наборов
+    не хранится.
+    """
+    versions = request_versions(request, resources)
+    # Путь с параметрами: у каждого объекта, страницы и фильтра свой ETag.
+    parts = [request.get_full_path(), request.accepted_renderer.format]
+    if accepts_gzip(request):
+        # Сжатое и несжатое представления — разные сущности.
+        parts.append('gzip')
+    parts += [versions[resource][0] for resource in resources]
+    last_modified = int(max(
+        modified for _, modified in versions.values()
+    ))
+    if personalized and request.user.is_authenticated:
+        parts.append(membership_version(get_membership(request)))
+        last_modified = None
+    digest = hashlib.md5(
+        ':'.join(parts).encode(), usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest), last_modified
+
+
+def check_object(view, kwargs):
+    """404, если объекта действия над одним объектом нет.
+
+    Версия ресурса не говорит, существует ли конкретный объект, поэтому
+    304 для него отдаётся только после поиска по первичному ключу.
+    """
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    if lookup_url_kwarg not in kwargs:
+        return
+    queryset = view.filter_queryset(view.get_queryset())
+    get_object_or_404(
+        queryset.prefetch_related(None).values('pk'),
+        **{view.lookup_field: kwargs[lookup_url_kwarg]},
+    )
+
+
+def conditional_get(*resources, personalized=False):
+    """Условный GET для действий вьюсета по версиям ресурсов.
+
+    При совпадении If-None-Match / If-Modified-Since отвечает 304 без
+    сериализации; для действий над одним объектом перед этим
+    проверяется, что он есть. Ресурс может быть функцией от вьюсета,
+    возвращающей имя ресурса или None.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            names = [
+                resource(self) if callable(resource) else resource
+                for resource in resources
+            ]
+            etag, last_modified = get_validators(
+                request, [name for name in names if name], personalized
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                check_object(self, kwargs)
+            else:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                if last_modified is not None:
+                    response.headers.setdefault(
+                        'Last-Modified', http_date(last_modified)
+                    )
+            # Ответ зависит от токена, а флаги — от пользователя, поэтому
+            # общие кэши не должны отдавать его другим клиентам.
+            patch_vary_headers(response, ('Authorization',))
+            if personalized and request.user.is_authenticated:
+                patch_cache_control(response, private=True)
+            return response
+        return wrapper
+    return decorator
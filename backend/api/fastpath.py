@@ -0,0 +1,364 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from api.membership import get_membership
+from api.serializers import (
+    RecipeSerializer,
+    RecipeShortSerializer,
+    get_recipes_limit,
+)
+from recipes.cache import get_cards, set_cards
+from recipes.images import srcset
+from recipes.models import Recipe, RecipeIngredient
+from users.models import User
+
+# Колонки .values() для полей, которые отдаются без преобразований.
+RECIPE_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'image': 'image',
+    'image_srcset': 'image_variants',
+    'text': 'text',
+    'cooking_time': 'cooking_time',
+}
+USER_COLUMNS = {
+    'email': 'email',
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'recipes_count': 'recipes_count',
+}
+SHORT_RECIPE_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'image': 'image',
+    'image_srcset': 'image_variants',
+    'cooking_time': 'cooking_time',
+}
+TAG_COLUMNS = {
+    'id': 'tag__id',
+    'name': 'tag__name',
+    'color': 'tag__color',
+    'slug': 'tag__slug',
+}
+INGREDIENT_COLUMNS = {
+    'id': 'ingredient_id',
+    'name': 'ingredient__name',
+    'measurement_unit': 'ingredient__measurement_unit',
+    'amount': 'amount',
+}
+IMAGE_FIELDS = frozenset(('image',))
+# Поле srcset: колонка изображения, с которой сверяются варианты.
+SRCSET_FIELDS = {'image_srcset': 'image'}
+
+
+def image_url(request=None):
+    # Повторяет FileField.to_representation из DRF.
+    def to_url(name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return to_url
+
+
+def compile_row(names, columns, to_url, nested=()):
+    """Собирает функцию row -> dict для выбранных полей.
+
+    Вложенные поля получают None и заполняются вызывающим кодом, так что
+    порядок ключей совпадает с порядком полей сериализатора.
+    """
+    names = tuple(names)
+    lookup = {name: columns[name] for name in names if name not in nested}
+    images = tuple(name for name in names if name in IMAGE_FIELDS)
+    srcsets = tuple(name for name in names if name in SRCSET_FIELDS)
+    if len(lookup) == len(names) and not images and not srcsets:
+        pairs = tuple(lookup.items())
+        return lambda row: {name: row[column] for name, column in pairs}
+
+    def build(row):
+        data = {
+            name: row[lookup[name]] if name in lookup else None
+            for name in names
+        }
+        for name in images:
+            data[name] = to_url(data[name])
+        for name in srcsets:
+            data[name] = srcset(data[name], row[SRCSET_FIELDS[name]], to_url)
+        return data
+    return build
+
+
+def selected_columns(names, columns, *extra):
+    return (
+        set(extra)
+        | {columns[name] for name in names if name in columns}
+        | {SRCSET_FIELDS[name] for name in names if name in SRCSET_FIELDS}
+    )
+
+
+def absolute_srcset(request, value):
+    return {
+        fmt: ', '.join(
+            f'{request.build_absolute_uri(url)} {width}'
+            for url, width in (
+                entry.rsplit(' ', 1) for entry in entries.split(', ')
+            )
+        )
+        for fmt, entries in value.items()
+    }
+
+
+def newest_per_author(queryset, limit):
+    """Не больше limit новых рецептов каждого автора.
+
+    ROW_NUMBER() OVER (PARTITION BY author_id) отсекает лишние строки
+    в БД, а не после загрузки всех рецептов авторов.
+    """
+    if limit is None:
+        return queryset
+    return queryset.annotate(position=Window(
+        RowNumber(),
+        partition_by=F('author_id'),
+        order_by=(F('pub_date').desc(), F('id').desc()),
+    )).filter(position__lte=limit)
+
+
+class UserReader:
+    """Быстрое чтение для UserSerializer без диспетчеризации полей DRF.
+
+    Принимает экземпляр сериализатора (корневой или вложенный), чтобы
+    выборка полей совпадала с ?fields= / ?expand=.
+    """
+
+    def __init__(self, request, serializer):
+        self.request = request
+        self.names = list(serializer.fields)
+        self.recipes_limit = get_recipes_limit(request)
+        self.recipe_names = []
+        if 'recipes' in self.names:
+            self.recipe_names = list(RecipeShortSerializer(
+                fieldset=serializer.get_child_fieldset('recipes')
+            ).fields)
+        self.build_row = compile_row(
+            self.names, USER_COLUMNS, image_url(request),
+            nested={'recipes', 'is_subscribed'},
+        )
+
+    def prepare(self, queryset):
+        return queryset.prefetch_related(None).values(
+            *selected_columns(self.names, USER_COLUMNS, 'id')
+        )
+
+    def build(self, rows):
+        rows = list(rows)
+        recipes = {}
+        if 'recipes' in self.names:
+            recipes = self._load_recipes([row['id'] for row in rows])
+        subscriptions = get_membership(self.request).subscriptions
+        data = []
+        for row in rows:
+            item = self.build_row(row)
+            if 'is_subscribed' in item:
+                item['is_subscribed'] = row['id'] in subscriptions
+            if 'recipes' in item:
+                item['recipes'] = recipes.get(row['id'], [])
+            data.append(item)
+        return data
+
+    def _load_recipes(self, author_ids):
+        # Как и в UserSerializer.get_recipes, вложенные рецепты
+        # сериализуются без request, поэтому URL картинок относительные.
+        build = compile_row(
+            self.recipe_names, SHORT_RECIPE_COLUMNS, image_url()
+        )
+        recipes = defaultdict(list)
+        for row in self.recipes_queryset(author_ids):
+            recipes[row['author_id']].append(build(row))
+        return recipes
+
+    def recipes_queryset(self, author_ids):
+        return (
+            newest_per_author(
+                Recipe.objects.filter(author_id__in=author_ids),
+                self.recipes_limit,
+            )
+            .order_by('-pub_date', '-id')
+            .values(*selected_columns(
+                self.recipe_names, SHORT_RECIPE_COLUMNS, 'author_id'
+            ))
+        )
+
+
+class RecipeReader:
+    """Быстрое чтение для RecipeSerializer из строк .values().
+
+    Теги, ингредиенты и авторы загружаются отдельными запросами по
+    списку id страницы, как и при prefetch_related.
+    """
+
+    nested = frozenset((
+        'tags', 'ingredients', 'author', 'is_favorited', 'is_in_shopping_cart'
+    ))
+
+    def __init__(self, request, serializer, author_queryset=None):
+        self.request = request
+        fields = serializer.fields
+        self.names = list(fields)
+        self.build_row = compile_row(
+            self.names, RECIPE_COLUMNS, image_url(request),
+            nested=self.nested,
+        )
+        if 'tags' in fields:
+            self.tag_names = list(fields['tags'].child.fields)
+        if 'ingredients' in fields:
+            self.ingredient_names = list(fields['ingredients'].child.fields)
+        if 'author' in fields:
+            self.author_reader = UserReader(request, fields['author'])
+            self.author_queryset = author_queryset
+
+    def prepare(self, queryset):
+        # Аннотации фильтров (например, search_rank) нужны курсору.
+        extra = ['id', 'pub_date', *queryset.query.annotations]
+        if 'author' in self.names:
+            extra.append('author_id')
+        return queryset.prefetch_related(None).values(
+            *selected_columns(self.names, RECIPE_COLUMNS, *extra)
+        )
+
+    def build(self, rows):
+        rows = list(rows)
+        ids = [row['id'] for row in rows]
+        tags = self._load_tags(ids) if 'tags' in self.names else {}
+        ingredients = (
+            self._load_ingredients(ids)
+            if 'ingredients' in self.names else {}
+        )
+        authors = {}
+        if 'author' in self.names:
+            authors = self._load_authors({row['author_id'] for row in rows})
+        membership = get_membership(self.request)
+        data = []
+        for row in rows:
+            item = self.build_row(row)
+            if 'is_favorited' in item:
+                item['is_favorited'] = row['id'] in membership.favorites
+            if 'is_in_shopping_cart' in item:
+                item['is_in_shopping_cart'] = (
+                    row['id'] in membership.shopping_cart
+                )
+            if 'tags' in item:
+                item['tags'] = tags.get(row['id'], [])
+            if 'ingredients' in item:
+                item['ingredients'] = ingredients.get(row['id'], [])
+            if 'author' in item:
+                item['author'] = authors[row['author_id']]
+            data.append(item)
+        return data
+
+    def _load_tags(self, ids):
+        build = compile_row(self.tag_names, TAG_COLUMNS, None)
+        tags = defaultdict(list)
+        for row in self.tags_queryset(ids):
+            tags[row['recipe_id']].append(build(row))
+        return tags
+
+    def tags_queryset(self, ids):
+        return (
+            Recipe.tags.through.objects.filter(recipe_id__in=ids)
+            .order_by('tag__name')
+            .values(*selected_columns(
+                self.tag_names, TAG_COLUMNS, 'recipe_id'
+            ))
+        )
+
+    def _load_ingredients(self, ids):
+        build = compile_row(self.ingredient_names, INGREDIENT_COLUMNS, None)
+        ingredients = defaultdict(list)
+        for row in self.ingredients_queryset(ids):
+            ingredients[row['recipe_id']].append(build(row))
+        return ingredients
+
+    def ingredients_queryset(self, ids):
+        return (
+            RecipeIngredient.objects.filter(recipe_id__in=ids)
+            .order_by('id')
+            .values(*selected_columns(
+                self.ingredient_names, INGREDIENT_COLUMNS, 'recipe_id'
+            ))
+        )
+
+    def _load_authors(self, author_ids):
+        reader = self.author_reader
+        rows = list(reader.prepare(
+            self.author_queryset.filter(id__in=author_ids)
+        ))
+        return {
+            row['id']: item for row, item in zip(rows, reader.build(rows))
+        }
+
+
+class RecipeCardReader:
+    """Страница рецептов из закэшированных карточек.
+
+    Карточка — представление рецепта по умолчанию без персональных
+    флагов и с относительным URL картинки. Запрос страницы выбирает
+    только id, флаги берутся из наборов текущего пользователя;
+    недостающие карточки строятся через RecipeReader и кладутся в кэш
+    под card_version рецепта, прочитанной тем же запросом страницы.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.reader = RecipeReader(None, RecipeSerializer(), User.objects)
+
+    def prepare(self, queryset):
+        return queryset.prefetch_related(None).values(
+            'id', 'pub_date', 'author_id', 'card_version',
+            *queryset.query.annotations
+        )
+
+    def build(self, rows):
+        rows = list(rows)
+        versions = {row['id']: row['card_version'] for row in rows}
+        cards = get_cards(versions)
+        missing = [row['id'] for row in rows if row['id'] not in cards]
+        if missing:
+            built = self._build_cards(missing)
+            set_cards(built, versions)
+            cards.update(built)
+        membership = get_membership(self.request)
+        data = []
+        for row in rows:
+            card = cards.get(row['id'])
+            if card is None:
+                continue
+            item = dict(card)
+            if item['image']:
+                item['image'] = self.request.build_absolute_uri(item['image'])
+            item['image_srcset'] = absolute_srcset(
+                self.request, item['image_srcset']
+            )
+            item['author'] = dict(
+                item['author'],
+                is_subscribed=row['author_id'] in membership.subscriptions,
+            )
+            item['is_favorited'] = row['id'] in membership.favorites
+            item['is_in_shopping_cart'] = (
+                row['id'] in membership.shopping_cart
+            )
+            data.append(item)
+        return data
+
+    def _build_cards(self, recipe_ids):
+        queryset = Recipe.objects.filter(id__in=recipe_ids)
+        return {
+            card['id']: card
+            for card in self.reader.build(self.reader.prepare(queryset))
+        }
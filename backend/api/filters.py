@@ -1,6 +1,25 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.db.models import Exists, F, FloatField, OuterRef, Q
+from django.db.models.functions import Cast
+
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Tag
+from recipes.models import SEARCH_CONFIG, Favorite, Recipe, ShoppingCart, Tag
+
+# Порядок выдачи поиска; по нему же работает курсорная пагинация.
+SEARCH_ORDERING = ('-search_rank', '-pub_date', '-id')
+# ?ordering=trending: по индексу trending_score_idx. Оба ключа берутся
+# из таблицы популярности, иначе сравнение курсора не станет условием
+# индекса.
+ORDERING_TRENDING = 'trending'
+TRENDING_ORDERING = ('-trending_score', '-trending_id')
+
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,6 +27,14 @@ class RecipeFilter(filters.FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=(
+            (TAGS_MATCH_ANY, 'Любой из тегов'),
+            (TAGS_MATCH_ALL, 'Все теги'),
+        ),
+        method='filter_tags_match',
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -15,19 +42,79 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=((ORDERING_TRENDING, 'Популярные сейчас'),),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
+    def filter_tags(self, queryset, name, value):
+        # Полусоединение вместо JOIN по tags__slug: рецепт с несколькими
+        # выбранными тегами не дублируется, а индекс (tag_id, recipe_id)
+        # позволяет начать план с тегов.
+        if not value:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        if self.form.cleaned_data.get('tags_match') == TAGS_MATCH_ALL:
+            # По EXISTS на каждый тег: на больших таблицах это заметно
+            # быстрее GROUP BY recipe_id HAVING COUNT(*) = n.
+            for tag in value:
+                queryset = queryset.filter(Exists(
+                    recipe_tags.filter(tag_id=tag.id)
+                ))
+            return queryset
+        return queryset.filter(Exists(
+            recipe_tags.filter(tag_id__in=[tag.id for tag in value])
+        ))
+
+    def filter_tags_match(self, queryset, name, value):
+        # Учитывается в filter_tags.
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(in_favorites=user)
+            return queryset.filter(Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(in_shopping_cart=user)
+            return queryset.filter(Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Полнотекстовое совпадение по названию и описанию со стеммингом
+        # или слово в названии, похожее на запрос (pg_trgm), — на случай
+        # опечаток. Ранг приводится к double precision: значение real
+        # не переживает JSON в курсоре без потери точности.
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query)
+                + TrigramWordSimilarity(value, 'name'),
+                output_field=FloatField(),
+            ),
+        ).filter(
+            Q(search_vector=query) | Q(name__trigram_word_similar=value)
+        ).order_by(*SEARCH_ORDERING)
+
+    def filter_ordering(self, queryset, name, value):
+        # Условие IS NOT NULL делает LEFT JOIN внутренним, и план идёт
+        # по индексу популярности; строка есть у каждого рецепта.
+        return queryset.annotate(
+            trending_score=F('trending__score'),
+            trending_id=F('trending__recipe_id'),
+        ).filter(trending_score__isnull=False).order_by(*TRENDING_ORDERING)
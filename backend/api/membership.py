@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import CharField, Value
+from django.utils.module_loading import import_string
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+Membership = namedtuple(
+    'Membership', ('favorites', 'shopping_cart', 'subscriptions')
+)
+EMPTY_MEMBERSHIP = Membership(frozenset(), frozenset(), frozenset())
+
+MEMBERSHIP_KINDS = {
+    Favorite: 'favorites',
+    ShoppingCart: 'shopping_cart',
+    Subscription: 'subscriptions',
+}
+
+
+class LocalMembershipBackend:
+    """LRU-кэш в памяти процесса, ограниченный max_size записями."""
+
+    def __init__(self, max_size=10_000, timeout=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, membership = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return membership
+
+    def set(self, user_id, membership):
+        with self._lock:
+            self._entries[user_id] = (
+                time.monotonic() + self.timeout, membership
+            )
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def update(self, user_id, kind, object_ids, present):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            expires, membership = entry
+            members = getattr(membership, kind)
+            if present:
+                members = members.union(object_ids)
+            else:
+                members = members.difference(object_ids)
+            self._entries[user_id] = (
+                expires, membership._replace(**{kind: members})
+            )
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class CacheMembershipBackend:
+    """Общий для воркеров кэш на базе Django cache.
+
+    Вытеснением занимается сам сервер кэша. При записи запись
+    пользователя удаляется, а не правится на месте, чтобы параллельные
+    запросы разных воркеров не теряли изменения друг друга.
+    """
+
+    def __init__(self, alias='default', timeout=300, key_prefix='membership'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def get(self, user_id):
+        return self.cache.get(self.key(user_id))
+
+    def set(self, user_id, membership):
+        self.cache.set(self.key(user_id), membership, self.timeout)
+
+    def update(self, user_id, kind, object_ids, present):
+        self.delete(user_id)
+
+    def delete(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = settings.MEMBERSHIP_CACHE
+        backend_class = import_string(config['BACKEND'])
+        _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+def membership_rows(user):
+    return Favorite.objects.filter(user=user).values_list(
+        Value('favorites', output_field=CharField()), 'recipe_id'
+    ).union(
+        ShoppingCart.objects.filter(user=user).values_list(
+            Value('shopping_cart', output_field=CharField()), 'recipe_id'
+        ),
+        Subscription.objects.filter(user=user).values_list(
+            Value('subscriptions', output_field=CharField()), 'author_id'
+        ),
+        all=True,
+    )
+
+
+def load_membership(user):
+    members = {kind: set() for kind in Membership._fields}
+    for kind, object_id in membership_rows(user):
+        members[kind].add(object_id)
+    return Membership(**{
+        kind: frozenset(ids) for kind, ids in members.items()
+    })
+
+
+def get_membership(request):
+    """Наборы id текущего пользователя, загружаемые один раз за запрос."""
+    if request is None or not request.user.is_authenticated:
+        return EMPTY_MEMBERSHIP
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        backend = get_backend()
+        membership = backend.get(request.user.id)
+        if membership is None:
+            membership = load_membership(request.user)
+            backend.set(request.user.id, membership)
+        request._membership = membership
+    return membership
+
+
+def record_membership(request, model, object_ids, present):
+    kind = MEMBERSHIP_KINDS[model]
+    get_backend().update(request.user.id, kind, object_ids, present)
+    request._membership = None
+
+
+def membership_version(membership):
+    # hash() для frozenset из int не зависит от PYTHONHASHSEED,
+    # поэтому версия совпадает во всех воркерах.
+    return format(hash(membership) & 0xFFFFFFFFFFFFFFFF, 'x')
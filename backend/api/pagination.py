@@ -1,7 +1,221 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import BooleanField, F, Func, Q, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RowComparison(Func):
+    """(a, b, ...) < (x, y, ...) для полей одного направления.
+
+    В отличие от цепочки OR такое условие PostgreSQL проверяет по
+    составному индексу и начинает чтение сразу с позиции курсора,
+    если все поля берутся из одной таблицы.
+    """
+
+    output_field = BooleanField()
+
+    def __init__(self, names, values, operator):
+        self.operator = operator
+        super().__init__(
+            *[F(name) for name in names], *[Value(value) for value in values]
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        parts, params = [], []
+        for expression in self.source_expressions:
+            sql, expression_params = compiler.compile(expression)
+            parts.append(sql)
+            params.extend(expression_params)
+        size = len(parts) // 2
+        return (
+            f'({", ".join(parts[:size])}) {self.operator} '
+            f'({", ".join(parts[size:])})',
+            params,
+        )
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 50
+
+
+class KeysetPagination(BasePagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), 'page'
+        )
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.version = getattr(view, 'cursor_version', None)
+        self.view = view
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        values, self.reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self._invert(field) for field in ordering]
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, values))
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        return self.page
+
+    def seek(self, queryset, request, ordering):
+        """Первые page_size + 1 строк queryset за курсором запроса.
+
+        Для источников со своими полями сортировки, которые по позициям
+        соответствуют self.ordering: страница затем выбирается
+        paginate_queryset из объединения таких срезов.
+        """
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, values))
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, item, reverse):
+        values = [
+            self._dump(self._get_value(item, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        payload = {'v': values, 'r': reverse}
+        if self.version is not None:
+            payload['e'] = self.version
+        payload = json.dumps(payload).encode()
+        cursor = urlsafe_b64encode(payload).decode().rstrip('=')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(
+                urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            )
+            values = [
+                self._load(field.lstrip('-'), value)
+                for field, value in zip(self.ordering, payload['v'])
+            ]
+            reverse = bool(payload.get('r'))
+            version = payload.get('e')
+            if version != getattr(self, 'version', None):
+                # Значения сортировки записаны в другой шкале: view
+                # переводит их в текущую или курсор недействителен.
+                upgrade = getattr(
+                    getattr(self, 'view', None), 'upgrade_cursor', None
+                )
+                if upgrade is None:
+                    raise NotFound(self.invalid_cursor_message)
+                values = upgrade(values, version)
+        except (
+            binascii.Error, ValueError, TypeError, KeyError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def _seek_filter(self, ordering, values):
+        directions = {field.startswith('-') for field in ordering}
+        if len(directions) == 1:
+            return RowComparison(
+                [field.lstrip('-') for field in ordering], values,
+                '<' if directions.pop() else '>',
+            )
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _get_value(self, item, name):
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def _dump(self, value):
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    def _load(self, name, value):
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
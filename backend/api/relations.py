@@ -0,0 +1,86 @@
+"""Запись избранного, корзины и подписок одним запросом.
+
+INSERT ... ON CONFLICT DO NOTHING RETURNING и DELETE ... RETURNING
+возвращают только строки, которые запрос действительно изменил, поэтому
+повторные и параллельные запросы не приводят к IntegrityError, а
+побочные обновления (суммы корзины, наборы membership) выполняются
+ровно один раз.
+"""
+from django.db import connection
+
+
+def _link_columns(model, target_field):
+    opts = model._meta
+    user = opts.get_field('user')
+    target = opts.get_field(target_field)
+    return (
+        opts.db_table,
+        user.column,
+        target.column,
+        target.related_model._meta.db_table,
+        target.target_field.column,
+        target.related_model is user.related_model,
+    )
+
+
+def _created_columns(model):
+    # INSERT в обход ORM: поля auto_now_add заполняются в SQL.
+    return [
+        field.column for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+
+
+def insert_links(model, user_id, target_field, target_ids):
+    """Возвращает id целей, для которых связь создана этим запросом.
+
+    Несуществующие цели и, для связей пользователя с пользователем,
+    он сам (prevent_self_subscription) отбрасываются в SELECT.
+    """
+    (
+        table, user_column, target_column,
+        target_table, target_pk, self_relation,
+    ) = _link_columns(model, target_field)
+    created = _created_columns(model)
+    columns = ', '.join([user_column, target_column, *created])
+    values = ', '.join(['%s', target_pk, *['NOW()'] * len(created)])
+    sql = (
+        f'INSERT INTO {table} ({columns}) '
+        f'SELECT {values} FROM {target_table} '
+        f'WHERE {target_pk} = ANY(%s)'
+    )
+    params = [user_id, list(target_ids)]
+    if self_relation:
+        sql += f' AND {target_pk} <> %s'
+        params.append(user_id)
+    sql += f' ON CONFLICT DO NOTHING RETURNING {target_column}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {target_id for target_id, in cursor.fetchall()}
+
+
+def delete_link_rows(model, user_id, target_field, target_ids, *fields):
+    """Кортежи (id цели, *fields) строк, удалённых этим запросом."""
+    table, user_column, target_column, *_ = _link_columns(
+        model, target_field
+    )
+    returning = ', '.join([target_column, *(
+        model._meta.get_field(name).column for name in fields
+    )])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE {user_column} = %s AND {target_column} = ANY(%s) '
+            f'RETURNING {returning}',
+            [user_id, list(target_ids)],
+        )
+        return cursor.fetchall()
+
+
+def delete_links(model, user_id, target_field, target_ids):
+    """Возвращает id целей, связь с которыми удалена этим запросом."""
+    return {
+        target_id for target_id, in delete_link_rows(
+            model, user_id, target_field, target_ids
+        )
+    }
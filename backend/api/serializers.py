@@ -1,9 +1,12 @@
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
 
-from recipes.fields import Base64ImageField
+from api.membership import get_membership
+from recipes.deletion import create as create_deletion
+from recipes.fields import Base64ImageField, SrcsetField
 from recipes.models import (
     MAX_COOKING_TIME,
     MAX_INGREDIENT_AMOUNT,
@@ -11,13 +14,99 @@ from recipes.models import (
     MIN_INGREDIENT_AMOUNT,
     Ingredient,
     Recipe,
+    RecipeDeletion,
     RecipeIngredient,
     Tag,
 )
+from recipes.shopping import (
+    add_recipe_ingredients,
+    remove_recipe_ingredients,
+)
 from users.models import Subscription, User
 
 MAX_AVATAR_SIZE = 2 * 1024 * 1024
 
+MAX_BATCH_SIZE = 500
+
+COMPACT_USER_FIELDS = (
+    'email',
+    'id',
+    'username',
+    'first_name',
+    'last_name',
+    'is_subscribed',
+)
+
+
+def get_recipes_limit(request):
+    """?recipes_limit= как число; без параметра или при ошибке — None."""
+    value = request.GET.get('recipes_limit', '') if request else ''
+    return int(value) if value.isdigit() else None
+
+
+def parse_field_paths(value):
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsetMixin:
+    """Выбор полей через ?fields=a,b.c и ?expand=b.d.
+
+    Вложенные сериализаторы адресуются через точку. Поля, не попавшие
+    в выборку, не сериализуются, а вьюсеты не запрашивают их из БД.
+    """
+
+    def __init__(self, *args, default_fields=None, fieldset=None, **kwargs):
+        self.default_fields = default_fields
+        self._fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    @property
+    def fieldset(self):
+        if self._fieldset is None:
+            parent, name = self.parent, self.field_name
+            if isinstance(parent, serializers.ListSerializer):
+                parent, name = parent.parent, parent.field_name
+            if parent is None:
+                self._fieldset = self._parse_request_fieldset()
+            else:
+                only, expand = getattr(parent, 'fieldset', ({}, {}))
+                self._fieldset = (only.get(name, {}), expand.get(name, {}))
+        return self._fieldset
+
+    def _parse_request_fieldset(self):
+        request = self.context.get('request')
+        if request is None:
+            return {}, {}
+        params = request.query_params
+        return (
+            parse_field_paths(params.get('fields', '')),
+            parse_field_paths(params.get('expand', '')),
+        )
+
+    def get_child_fieldset(self, name):
+        only, expand = self.fieldset
+        return only.get(name, {}), expand.get(name, {})
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.fieldset
+        if only:
+            selected = [name for name in fields if name in only]
+        elif self.default_fields is None:
+            return fields
+        else:
+            selected = [
+                name for name in fields
+                if name in self.default_fields or name in expand
+            ]
+        return {name: fields[name] for name in selected}
+
 
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -46,16 +135,18 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_srcset = SrcsetField('image', 'image_variants')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -71,23 +162,22 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.subscriptions.filter(author=obj).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.subscriptions
 
     def get_recipes(self, obj):
-        request = self.context['request']
-        limit = request.GET.get('recipes_limit')
+        # С Prefetch из plan_user_queryset срез берётся из кэша.
+        limit = get_recipes_limit(self.context.get('request'))
         recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = RecipeShortSerializer(recipes, many=True)
+        if limit is not None:
+            recipes = recipes[:limit]
+        serializer = RecipeShortSerializer(
+            recipes,
+            many=True,
+            fieldset=self.get_child_fieldset('recipes'),
+        )
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -140,21 +230,26 @@ class ChangePasswordSerializer(serializers.Serializer):
     def save(self, **kwargs):
         user = self.context['request'].user
         user.set_password(self.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return user
 
 
 class UserAvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField()
+    avatar_srcset = SrcsetField('avatar', 'avatar_variants')
 
     class Meta:
         model = User
-        fields = ('avatar',)
+        fields = ('avatar', 'avatar_srcset')
 
     def update(self, instance, validated_data):
         if instance.avatar:
             default_storage.delete(instance.avatar.path)
-        return super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Аватар не входит в карточки рецептов автора.
+        instance.save(update_fields=list(validated_data))
+        return instance
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -179,6 +274,66 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
+
+
+class RecipeDeletionSerializer(serializers.ModelSerializer):
+    author = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        required=False,
+    )
+    recipe_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        required=False,
+        write_only=True,
+    )
+
+    class Meta:
+        model = RecipeDeletion
+        fields = (
+            'id',
+            'author',
+            'recipe_ids',
+            'status',
+            'total',
+            'deleted',
+            'last_id',
+            'error',
+            'created',
+            'finished',
+        )
+        read_only_fields = (
+            'status',
+            'total',
+            'deleted',
+            'last_id',
+            'error',
+            'created',
+            'finished',
+        )
+
+    def validate(self, attrs):
+        if ('author' in attrs) == ('recipe_ids' in attrs):
+            raise serializers.ValidationError(
+                'Укажите либо автора, либо список id рецептов'
+            )
+        return attrs
+
+    def create(self, validated_data):
+        author = validated_data.get('author')
+        return create_deletion(
+            self.context['request'].user,
+            author_id=author.pk if author else None,
+            recipe_ids=validated_data.get('recipe_ids'),
+        )
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -228,15 +383,19 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
-    author = UserSerializer(read_only=True)
+    author = UserSerializer(
+        read_only=True,
+        default_fields=COMPACT_USER_FIELDS,
+    )
     ingredients = RecipeIngredientSerializer(
         source='recipe_ingredients',
         many=True,
         read_only=True,
     )
     image = Base64ImageField(read_only=True)
+    image_srcset = SrcsetField('image', 'image_variants')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -249,6 +408,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
             'is_favorited',
@@ -257,16 +417,12 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return obj.in_favorites.filter(id=user.id).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return obj.in_shopping_cart.filter(id=user.id).exists()
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.shopping_cart
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -312,6 +468,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -321,6 +478,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self._create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
@@ -333,8 +491,10 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             instance.tags.set(tags)
 
         if ingredients is not None:
+            remove_recipe_ingredients(instance.id)
             instance.recipe_ingredients.all().delete()
             self._create_ingredients(instance, ingredients)
+            add_recipe_ingredients(instance.id)
 
         instance.save()
         return instance
@@ -0,0 +1,144 @@
+import csv
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Sum
+from django.template.loader import get_template
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import (
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+)
+
+CHUNK_SIZE = 500
+
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 11
+PDF_LEADING = 16
+PDF_MARGIN = 50
+
+
+def shopping_list_rows(user):
+    """Готовые суммы из ShoppingListItem: одно чтение по индексу."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            total=F('total_amount'),
+        )
+        .order_by('name', 'measurement_unit')
+    )
+
+
+def aggregate_shopping_list(user):
+    """Те же суммы, посчитанные по корзине одним GROUP BY.
+
+    Агрегируется RecipeIngredient, а корзина подключается через EXISTS,
+    поэтому каждая строка рецепта учитывается ровно один раз.
+    """
+    return (
+        RecipeIngredient.objects
+        .filter(Exists(ShoppingCart.objects.filter(
+            user=user, recipe_id=OuterRef('recipe_id')
+        )))
+        .values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        )
+        .annotate(total=Sum('amount'))
+        .order_by('name', 'measurement_unit')
+    )
+
+
+def batches(rows, size=CHUNK_SIZE):
+    batch = []
+    for row in rows.iterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_text(user, rows):
+    template = get_template('shopping_list.txt')
+    header = True
+    for batch in batches(rows):
+        yield template.render({
+            'user': user, 'ingredients': batch, 'header': header,
+        })
+        header = False
+    if header:
+        yield template.render({
+            'user': user, 'ingredients': [], 'header': True,
+        })
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for batch in batches(rows):
+        yield ''.join(
+            writer.writerow((
+                row['name'], row['measurement_unit'], row['total'],
+            ))
+            for row in batch
+        )
+
+
+def pdf_font():
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    return PDF_FONT
+
+
+def render_pdf(user, rows):
+    """PDF из тех же строк, что и текстовый список.
+
+    Формат PDF требует таблицу смещений в конце файла, поэтому документ
+    собирается в памяти, но строки из БД читаются порциями.
+    """
+    font = pdf_font()
+    page_width, page_height = A4
+    line_width = page_width - 2 * PDF_MARGIN
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    text = None
+    for chunk in render_text(user, rows):
+        for line in chunk.splitlines():
+            parts = simpleSplit(line, font, PDF_FONT_SIZE, line_width)
+            for part in parts or ['']:
+                if text is not None and text.getY() < PDF_MARGIN:
+                    pdf.drawText(text)
+                    pdf.showPage()
+                    text = None
+                if text is None:
+                    text = pdf.beginText(PDF_MARGIN, page_height - PDF_MARGIN)
+                    text.setFont(font, PDF_FONT_SIZE, leading=PDF_LEADING)
+                text.textLine(part)
+    if text is not None:
+        pdf.drawText(text)
+    pdf.save()
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,98 @@
+import gzip
+import re
+import threading
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.cache import get_versions
+from recipes.models import Ingredient, Tag
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def accepts_gzip(request):
+    return bool(ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    ))
+
+
+def request_versions(request, resources):
+    """Версии ресурсов, прочитанные из БД один раз за запрос."""
+    versions = getattr(request, '_resource_versions', None)
+    if versions is None:
+        versions = request._resource_versions = {}
+    missing = [resource for resource in resources if resource not in versions]
+    if missing:
+        versions.update(get_versions(missing))
+    return {resource: versions[resource] for resource in resources}
+
+
+class VersionedSnapshot:
+    """Значение в памяти воркера, привязанное к версии ресурса.
+
+    Пересобирается, только когда меняется версия ресурса в БД, то есть
+    после правок через админку, load_ingredients или
+    refresh_reference_data в любом процессе.
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.version = None
+        self.value = None
+        self._lock = threading.Lock()
+
+    def get(self, request=None):
+        if request is None:
+            versions = get_versions([self.resource])
+        else:
+            versions = request_versions(request, [self.resource])
+        version = versions[self.resource][0]
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
+
+    def build(self):
+        raise NotImplementedError
+
+
+class ReferenceSnapshot(VersionedSnapshot):
+    """Готовый JSON справочника и его gzip-копия."""
+
+    def __init__(self, resource, queryset, serializer_class):
+        super().__init__(resource)
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+
+    def build(self):
+        content = JSONRenderer().render(
+            self.serializer_class(self.queryset.all(), many=True).data
+        )
+        return content, gzip.compress(content, mtime=0)
+
+
+tag_snapshot = ReferenceSnapshot('tags', Tag.objects.all(), TagSerializer)
+ingredient_snapshot = ReferenceSnapshot(
+    'ingredients', Ingredient.objects.all(), IngredientSerializer
+)
+
+
+def snapshot_response(request, snapshot):
+    """Ответ из снимка или None, если клиент просит не JSON."""
+    if request.accepted_renderer.format != 'json':
+        return None
+    content, compressed = snapshot.get(request)
+    response = HttpResponse(content_type='application/json')
+    if accepts_gzip(request):
+        response.content = compressed
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response.content = content
+    response['Content-Length'] = len(response.content)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
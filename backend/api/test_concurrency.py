@@ -0,0 +1,219 @@
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from api.membership import get_backend
+from api.tests import create_recipe, create_user
+from recipes.counters import consolidate
+from recipes.counters import find_drift as find_counter_drift
+from recipes.models import (
+    CounterDelta,
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+)
+from recipes.shopping import find_drift
+from users.models import Subscription
+
+WORKERS = 32
+
+
+@contextmanager
+def row_lock(model, pk):
+    """Держит строку pk в другой транзакции, пока открыт блок.
+
+    Строка освобождается и по таймауту, чтобы запросы, которые всё-таки
+    ждут блокировку, не подвесили тест.
+    """
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        try:
+            with transaction.atomic():
+                model.objects.select_for_update(no_key=True).get(pk=pk)
+                locked.set()
+                release.wait(timeout=30)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    locked.wait()
+    try:
+        yield
+    finally:
+        release.set()
+        thread.join()
+
+
+class ConcurrencyTestCase(APITransactionTestCase):
+    """Параллельные запросы из потоков, у каждого своё соединение с БД.
+
+    serialized_rollback возвращает строки, созданные миграциями
+    (TrendingBase), после очистки таблиц предыдущим тестом.
+    """
+
+    serialized_rollback = True
+
+    def setUp(self):
+        cache.clear()
+        self.users = [create_user(f'user-{number}') for number in range(4)]
+        for user in self.users:
+            get_backend().delete(user.id)
+
+    def fire(self, requests):
+        """Статусы ответов по ключам запросов (key, user, method, path)."""
+        def send(request):
+            key, user, method, path = request
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user)
+            try:
+                return key, getattr(client, method)(path).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(WORKERS) as pool:
+            results = list(pool.map(send, requests))
+        statuses = defaultdict(Counter)
+        for key, status_code in results:
+            statuses[key][status_code] += 1
+        return statuses
+
+
+class ConcurrentLinkTests(ConcurrencyTestCase):
+    # 28 ключей по 25 копий: 700 запросов на фазу.
+    copies = 25
+
+    def setUp(self):
+        super().setUp()
+        author = create_user('author')
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Соль')
+        ]
+        recipes = [
+            create_recipe(author, f'Рецепт {number}', (), ingredients).id
+            for number in range(2)
+        ]
+        authors = [author.id, create_user('other-author').id]
+        self.links = {
+            'favorite': (Favorite, 'recipe', 'recipes', recipes),
+            'shopping_cart': (ShoppingCart, 'recipe', 'recipes', recipes),
+            'subscribe': (Subscription, 'author', 'users', authors),
+        }
+
+    def test_repeated_requests(self):
+        keys = [
+            (action, user, target_id)
+            for action, (*_, targets) in self.links.items()
+            for user in self.users
+            for target_id in targets
+        ]
+        phases = (
+            ('post', status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST),
+            ('delete', status.HTTP_204_NO_CONTENT, status.HTTP_404_NOT_FOUND),
+        )
+        for method, done, repeated in phases:
+            requests = [
+                (
+                    (action, user.id, target_id), user, method,
+                    f'/api/{self.links[action][2]}/{target_id}/{action}/',
+                )
+                for action, user, target_id in keys
+                for _ in range(self.copies)
+            ]
+            requests += [
+                (('self', user.id, user.id), user, method,
+                 f'/api/users/{user.id}/subscribe/')
+                for user in self.users
+                for _ in range(self.copies)
+            ]
+            statuses = self.fire(requests)
+            for key, counts in sorted(statuses.items()):
+                with self.subTest(method=method, key=key):
+                    if key[0] == 'self':
+                        self.assertEqual(counts, Counter({
+                            status.HTTP_400_BAD_REQUEST: self.copies
+                        }))
+                    else:
+                        self.assertEqual(counts, Counter({
+                            done: 1, repeated: self.copies - 1
+                        }))
+            for action, user, target_id in keys:
+                model, field, *_ = self.links[action]
+                self.assertEqual(
+                    model.objects.filter(
+                        user=user, **{field: target_id}
+                    ).exists(),
+                    method == 'post',
+                )
+            self.assertEqual(find_drift(), [])
+
+
+class ConcurrentCounterTests(ConcurrencyTestCase):
+    """Счётчик популярного рецепта не становится очередью.
+
+    Запросы не ждут даже строку, которую держит другая транзакция,
+    а их изменения остаются в CounterDelta до consolidate.
+    """
+
+    def setUp(self):
+        super().setUp()
+        author = create_user('author')
+        self.recipes = [
+            create_recipe(author, f'Рецепт {number}').id
+            for number in range(len(self.users))
+        ]
+
+    def toggle_favorites(self, targets, locked=False):
+        hot = self.recipes[0]
+        for method, done, count in (
+            ('post', status.HTTP_201_CREATED, 1),
+            ('delete', status.HTTP_204_NO_CONTENT, 0),
+        ):
+            requests = [
+                ((user.id, recipe_id), user, method,
+                 f'/api/recipes/{recipe_id}/favorite/')
+                for user, recipe_id in zip(self.users, targets)
+            ]
+            if locked:
+                with row_lock(Recipe, hot):
+                    statuses = self.fire(requests)
+                self.assertEqual(
+                    CounterDelta.objects.filter(
+                        counter='favorites_count', object_id=hot
+                    ).count(),
+                    len(self.users),
+                )
+            else:
+                statuses = self.fire(requests)
+            self.assertEqual(
+                [dict(counts) for counts in statuses.values()],
+                [{done: 1}] * len(self.users),
+            )
+            consolidate()
+            self.assertFalse(CounterDelta.objects.exists())
+            self.assertEqual(
+                dict(Recipe.objects.filter(id__in=targets).values_list(
+                    'id', 'favorites_count'
+                )),
+                {recipe_id: count * targets.count(recipe_id)
+                 for recipe_id in targets},
+            )
+        self.assertEqual(find_counter_drift('favorites_count'), [])
+
+    def test_hot_recipe(self):
+        self.toggle_favorites([self.recipes[0]] * len(self.users))
+
+    def test_locked_hot_recipe(self):
+        self.toggle_favorites([self.recipes[0]] * len(self.users), True)
+
+    def test_spread_recipes(self):
+        self.toggle_favorites(self.recipes)
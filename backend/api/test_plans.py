@@ -0,0 +1,208 @@
+import json
+
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.fastpath import RecipeCardReader, RecipeReader, UserReader
+from api.filters import TRENDING_ORDERING
+from api.membership import membership_rows
+from api.pagination import KeysetPagination
+from api.shopping_list import aggregate_shopping_list, shopping_list_rows
+from api.tests import FoodgramTestCase, create_user
+from api.views import RecipeViewSet, UserViewSet, plan_user_queryset
+from recipes.feed import TIMELINE_ORDERING, rebuild, timeline
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeSimilarity,
+    ShoppingCart,
+    ShoppingListItem,
+    TimelineEntry,
+    TrendingScore,
+)
+from recipes.shopping import rebuild_users
+from users.models import Subscription, User
+
+# Таблицы, которые в продакшене растут вместе с числом рецептов
+# и пользователей; справочник тегов маленький.
+LARGE_TABLES = frozenset(model._meta.db_table for model in (
+    Favorite, Ingredient, Recipe, Recipe.tags.through, RecipeIngredient,
+    RecipeSimilarity, ShoppingCart, ShoppingListItem, Subscription,
+    TimelineEntry, TrendingScore, User,
+))
+
+
+def make_view(viewset, path, action, user):
+    request = APIRequestFactory().get(path)
+    force_authenticate(request, user=user)
+    view = viewset(action_map={'get': action}, format_kwarg=None, kwargs={})
+    view.request = view.initialize_request(request)
+    return view
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(node.get('Plans', ()))
+
+
+class QueryPlanTests(FoodgramTestCase):
+    """Горячие запросы вьюсетов читают большие таблицы по индексам.
+
+    На тестовой базе таблицы маленькие, и планировщику дешевле прочитать
+    их целиком, поэтому enable_seqscan выключен: Seq Scan остаётся
+    в плане, только когда подходящего индекса нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        authors = [
+            create_user(f'plan-author-{number}') for number in range(20)
+        ]
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10,
+            )
+            for author in authors for number in range(50)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(200)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=cls.tags[number % 2])
+            for number, recipe in enumerate(recipes)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, amount=100,
+                ingredient=ingredients[(number + offset) % len(ingredients)],
+            )
+            for number, recipe in enumerate(recipes) for offset in range(3)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::10]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::50]
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.reader, author=author)
+            for author in authors[::2]
+        )
+        TrendingScore.objects.bulk_create(
+            TrendingScore(recipe=recipe, score=number % 97)
+            for number, recipe in enumerate(recipes)
+        )
+        RecipeSimilarity.objects.bulk_create(
+            RecipeSimilarity(recipe=recipe, similar=similar, score=0.5)
+            for recipe, similar in zip(recipes, recipes[1:])
+        )
+        rebuild_users([cls.reader.id])
+        rebuild()
+        cls.recipe = recipes[len(recipes) // 2]
+        with connection.cursor() as cursor:
+            for table in sorted(LARGE_TABLES):
+                cursor.execute(f'ANALYZE {table}')
+
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def hot_queries(self):
+        """ORM-запросы, которые вьюсеты выполняют на горячих путях."""
+        user, recipe = self.reader, self.recipe
+
+        def feed(path='/api/recipes/'):
+            view = make_view(RecipeViewSet, path, 'list', user)
+            reader = RecipeCardReader(view.request)
+            return reader.prepare(view.filter_queryset(view.get_queryset()))
+
+        ordering = KeysetPagination.ordering
+        page = feed().order_by(*ordering)[:7]
+        yield 'feed first page', page
+        yield 'feed next page', feed().filter(
+            KeysetPagination()._seek_filter(
+                ordering, [recipe.pub_date, recipe.id]
+            )
+        ).order_by(*ordering)[:7]
+        yield 'author feed', feed(
+            f'/api/recipes/?author={recipe.author_id}'
+        ).order_by(*ordering)[:7]
+        yield 'tags feed', feed(
+            '/api/recipes/?tags=breakfast&tags=lunch'
+        ).order_by(*ordering)[:7]
+        yield 'favorited feed', feed(
+            '/api/recipes/?is_favorited=1'
+        ).order_by(*ordering)[:7]
+        trending = TrendingScore.objects.order_by('-score', '-recipe').first()
+        yield 'trending first page', feed(
+            '/api/recipes/?ordering=trending'
+        )[:7]
+        yield 'trending next page', feed(
+            '/api/recipes/?ordering=trending'
+        ).filter(KeysetPagination()._seek_filter(
+            TRENDING_ORDERING, [trending.score, trending.recipe_id]
+        ))[:7]
+        yield 'subscriptions feed', timeline(user).order_by(
+            *TIMELINE_ORDERING
+        )[:7]
+
+        ids = [row['id'] for row in page]
+        view = make_view(RecipeViewSet, '/api/recipes/', 'list', user)
+        reader = RecipeReader(
+            None, view.get_read_serializer(), User.objects.all()
+        )
+        yield 'card tags', reader.tags_queryset(ids)
+        yield 'card ingredients', reader.ingredients_queryset(ids)
+        yield 'similar recipes', RecipeSimilarity.objects.filter(
+            recipe_id=recipe.id
+        ).select_related('similar').order_by('-score', 'similar_id')
+        yield 'ingredient prefix', Ingredient.objects.filter(
+            name__istartswith='Ингредиент 1'
+        )
+        yield 'membership', membership_rows(user)
+        yield 'shopping list', shopping_list_rows(user)
+        yield 'shopping list aggregate', aggregate_shopping_list(user)
+        yield 'favorite lookup', Favorite.objects.filter(
+            user=user, recipe=recipe
+        )
+        view = make_view(
+            UserViewSet, '/api/users/subscriptions/?recipes_limit=3',
+            'subscriptions', user,
+        )
+        serializer = view.get_read_serializer()
+        reader = UserReader(view.request, serializer)
+        authors = reader.prepare(plan_user_queryset(
+            User.objects.filter(subscriptions__user=user),
+            serializer.fields,
+        ).order_by('id'))[:6]
+        yield 'subscriptions', authors
+        yield 'subscription recipes', reader.recipes_queryset(
+            [row['id'] for row in authors]
+        )
+
+    def test_hot_queries_use_indexes(self):
+        for label, queryset in self.hot_queries():
+            with self.subTest(label):
+                self.assertTrue(list(queryset.all()))
+                seq_scans = sorted({
+                    node['Relation Name'] for node in explain(queryset)
+                    if node['Node Type'] == 'Seq Scan'
+                } & LARGE_TABLES)
+                self.assertEqual(seq_scans, [])
@@ -0,0 +1,643 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.autocomplete import IngredientIndex, ingredient_index
+from api.membership import get_backend
+from api.pagination import KeysetPagination
+from api.shopping_list import aggregate_shopping_list, shopping_list_rows
+from api.views import SHOPPING_LIST_FORMATS
+from recipes.cache import card_stats, get_versions
+from recipes.deletion import create as create_deletion
+from recipes.feed import rebuild
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    MediaDeletion,
+    MergedFeedAuthor,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.shopping import find_drift
+from users.models import Subscription, User
+
+# Отдельный кэш в памяти, как у команды в другом процессе.
+other_process = override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'other-process',
+}})
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name,
+        first_name=name, last_name='Test', password='password',
+    )
+
+
+def create_recipe(author, name, tags=(), ingredients=()):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text=f'{name}: описание',
+        image='recipes/images/test.png', cooking_time=10,
+    )
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=100)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class FoodgramTestCase(APITestCase):
+    """Автор, читатель, два тега и два ингредиента.
+
+    Перед тестом очищаются кэш карточек и наборы пользователей, а строки
+    версий ресурсов создаются заранее, чтобы число запросов не зависело
+    от порядка тестов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast'),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name='Мука', measurement_unit='г'),
+            Ingredient.objects.create(name='Соль', measurement_unit='г'),
+        ]
+        get_versions(('recipes', 'tags', 'ingredients', 'trending'))
+
+    def setUp(self):
+        cache.clear()
+        for user in (self.author, self.reader):
+            get_backend().delete(user.id)
+
+    def run_in_other_process(self, *args):
+        """Команда со своим кэшем, как cron или другой контейнер."""
+        with other_process, self.captureOnCommitCallbacks(execute=True):
+            call_command(*args, stdout=StringIO())
+
+    def create_recipes(self, count, author=None):
+        return [
+            create_recipe(
+                author or self.author, f'Рецепт {number}',
+                self.tags, self.ingredients,
+            )
+            for number in range(count)
+        ]
+
+
+class ConditionalGetTests(FoodgramTestCase):
+    def test_etag_depends_on_path(self):
+        first, second = self.create_recipes(2)
+        etags = {
+            self.client.get(path)['ETag']
+            for path in (
+                f'/api/recipes/{first.id}/',
+                f'/api/recipes/{second.id}/',
+                '/api/recipes/',
+                '/api/recipes/?page=2&limit=1',
+                '/api/recipes/?tags=lunch',
+            )
+        }
+        self.assertEqual(len(etags), 5)
+
+    def test_not_modified(self):
+        recipe, = self.create_recipes(1)
+        path = f'/api/recipes/{recipe.id}/'
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_recipe_is_not_modified_only_after_lookup(self):
+        recipe, = self.create_recipes(1)
+        last_modified = self.client.get('/api/recipes/')['Last-Modified']
+        for path in (
+            f'/api/recipes/{recipe.id + 1000}/',
+            f'/api/recipes/{recipe.id + 1000}/similar/',
+        ):
+            response = self.client.get(
+                path, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(
+            f'/api/recipes/{recipe.id}/', HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ReferenceDataTests(FoodgramTestCase):
+    def test_refresh_reference_data(self):
+        response = self.client.get('/api/ingredients/')
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Сахар', measurement_unit='г')]
+        )
+        self.run_in_other_process('refresh_reference_data')
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Сахар', [item['name'] for item in response.json()])
+
+    def test_load_ingredients(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        self.run_in_other_process('load_ingredients')
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            len(response.json()), Ingredient.objects.count()
+        )
+        response = self.client.get('/api/ingredients/?name=сах')
+        self.assertTrue(response.json())
+
+
+class RecipeQueryCountTests(FoodgramTestCase):
+    """Число запросов ленты и рецепта не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = [
+            create_recipe(cls.author, f'Рецепт {number}', cls.tags,
+                          cls.ingredients)
+            for number in range(50)
+        ]
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=cls.reader, recipe=recipe)
+                for recipe in recipes[::2]
+            )
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def test_list(self):
+        # Версии, наборы пользователя, COUNT, id страницы; затем рецепты,
+        # теги, ингредиенты и авторы карточек, которых нет в кэше.
+        for size in (6, 50):
+            with self.subTest(size=size):
+                cache.clear()
+                get_backend().delete(self.reader.id)
+                with self.assertNumQueries(8):
+                    response = self.client.get(f'/api/recipes/?limit={size}')
+                results = response.json()['results']
+                self.assertEqual(len(results), size)
+                self.assertTrue(any(
+                    item['is_favorited'] and item['is_in_shopping_cart']
+                    for item in results
+                ))
+                self.assertEqual(len(results[0]['ingredients']), 2)
+
+    def test_detail(self):
+        # Как у ленты, но вместо COUNT и страницы — строка рецепта.
+        with self.assertNumQueries(7):
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertTrue(response.json()['is_favorited'])
+
+
+class EndpointQueryBudgetTests(FoodgramTestCase):
+    """Число запросов на обоих путях чтения, API_FAST_READ_PATH=True/False.
+
+    Страницы разного размера укладываются в один бюджет: вложенные
+    теги, ингредиенты, авторы и рецепты авторов грузятся запросом
+    на страницу, а не на объект.
+    """
+
+    # (путь, запросов на быстром пути, запросов через сериализаторы).
+    budgets = (
+        ('/api/recipes/?limit=6', 8, 7),
+        ('/api/recipes/?limit=24', 8, 7),
+        ('/api/recipes/{recipe}/', 7, 6),
+        ('/api/recipes/?limit=24&expand=author.recipes', 8, 8),
+        ('/api/users/?limit=2', 4, 4),
+        ('/api/users/?limit=10', 4, 4),
+        ('/api/users/{author}/', 3, 3),
+        ('/api/users/subscriptions/?limit=2', 4, 4),
+        ('/api/users/subscriptions/?limit=8&recipes_limit=1', 4, 4),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(8):
+            author = create_user(f'author{number}')
+            for _ in range(3):
+                cls.recipe = create_recipe(
+                    author, f'Рецепт {number}', cls.tags, cls.ingredients
+                )
+            Subscription.objects.create(user=cls.reader, author=author)
+
+    def test_budgets(self):
+        self.client.force_authenticate(self.reader)
+        for fast in (True, False):
+            for path, *budget in self.budgets:
+                path = path.format(
+                    recipe=self.recipe.id, author=self.recipe.author_id
+                )
+                with self.subTest(path=path, fast=fast):
+                    cache.clear()
+                    get_backend().delete(self.reader.id)
+                    with override_settings(API_FAST_READ_PATH=fast):
+                        with self.assertNumQueries(budget[not fast]):
+                            response = self.client.get(path)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BackgroundCommandTests(FoodgramTestCase):
+    """Изменения из команд видны API без общего кэша."""
+
+    def test_image_variants(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            recipe, = self.create_recipes(1)
+            with open('recipes/fixtures/test_image.jpg', 'rb') as file:
+                recipe.image = default_storage.save(
+                    'recipes/images/test.webp', File(file)
+                )
+            recipe.save(update_fields=['image'])
+            response = self.client.get('/api/recipes/')
+            self.assertEqual(response.json()['results'][0]['image_srcset'], {})
+            self.run_in_other_process(
+                'build_image_variants', '--only', 'recipes', '--workers', '1'
+            )
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.json()['results'][0]['image_srcset']),
+            {'webp', 'jpeg'},
+        )
+
+    def test_similar_recipes(self):
+        first, second = self.create_recipes(2)
+        Favorite.objects.bulk_create([
+            Favorite(user=self.reader, recipe=first),
+            Favorite(user=self.reader, recipe=second),
+        ])
+        path = f'/api/recipes/{first.id}/similar/'
+        response = self.client.get(path)
+        self.assertEqual(response.json(), [])
+        self.run_in_other_process('build_similar_recipes')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in response.json()], [second.id]
+        )
+
+    def test_trending(self):
+        self.create_recipes(2)
+        path = '/api/recipes/?ordering=trending'
+        etag = self.client.get(path)['ETag']
+        self.run_in_other_process('renormalize_trending', '--rebuild')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_delete_recipes(self):
+        recipes = self.create_recipes(3)
+        files = []
+        for recipe in recipes:
+            image = f'recipes/images/{recipe.id}.png'
+            variant = f'recipes/variants/{recipe.id}-320.webp'
+            Recipe.objects.filter(id=recipe.id).update(
+                image=image,
+                image_variants={'source': image, 'webp': [[320, variant]]},
+            )
+            files += [image, variant]
+        self.client.force_authenticate(self.reader)
+        for recipe in recipes:
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        path = f'/api/recipes/{recipes[0].id}/'
+        list_etag = self.client.get('/api/recipes/')['ETag']
+        detail_etag = self.client.get(path)['ETag']
+        create_deletion(None, author_id=self.author.id)
+        self.run_in_other_process('delete_recipes', '--batch-size', '2')
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=list_etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertCountEqual(
+            MediaDeletion.objects.values_list('name', flat=True), files
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertEqual(find_drift(), [])
+
+
+class RecipeCardCacheTests(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(10):
+            create_recipe(cls.author, f'Рецепт {number}', cls.tags,
+                          cls.ingredients)
+
+    def test_warm_page_runs_no_recipe_detail_sql(self):
+        self.client.force_authenticate(self.reader)
+        path = '/api/recipes/?limit=10'
+        cold = self.client.get(path)
+        hits = card_stats['hits']
+        # Версии, COUNT и id страницы; наборы пользователя уже в кэше.
+        with self.assertNumQueries(3) as queries:
+            warm = self.client.get(path)
+        self.assertEqual(card_stats['hits'] - hits, 10)
+        self.assertEqual(warm.content, cold.content)
+        detail_tables = (
+            'recipes_recipe_tags', 'recipes_recipeingredient', 'users_user'
+        )
+        for query in queries.captured_queries:
+            self.assertFalse(
+                [table for table in detail_tables if table in query['sql']]
+            )
+            self.assertNotIn('"recipes_recipe"."text"', query['sql'])
+
+    def test_change_replaces_cached_card(self):
+        recipe = Recipe.objects.first()
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Новое название'
+            recipe.save()
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.json()['name'], 'Новое название')
+
+    def misses_after(self, change):
+        """Карточки, которые страница строит заново после change."""
+        path = '/api/recipes/?limit=10'
+        self.client.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        misses = card_stats['misses']
+        self.client.get(path)
+        return card_stats['misses'] - misses
+
+    def test_change_rebuilds_only_affected_cards(self):
+        first, second = Recipe.objects.all()[:2]
+        dinner = Tag.objects.create(name='Ужин', color='#8775D2',
+                                    slug='dinner')
+        changes = {
+            'recipe': (lambda: first.save(), 1),
+            'recipe tags': (lambda: second.tags.add(dinner), 1),
+            'tag': (lambda: dinner.save(), 1),
+            'ingredient': (lambda: self.ingredients[0].save(), 10),
+            'author': (lambda: self.author.save(), 10),
+        }
+        for label, (change, rebuilt) in changes.items():
+            with self.subTest(label):
+                self.assertEqual(self.misses_after(change), rebuilt)
+
+    def test_password_and_avatar_keep_cards(self):
+        # set_password проверяет текущий пароль по username как по email.
+        User.objects.filter(id=self.author.id).update(
+            username=self.author.email, avatar='users/avatars/missing.png'
+        )
+        self.author.refresh_from_db()
+        self.client.force_authenticate(self.author)
+        changes = {
+            'password': lambda: self.client.post(
+                '/api/users/set_password/',
+                {'current_password': 'password', 'new_password': 'Zx9!qwerty'},
+            ),
+            'avatar': lambda: self.client.delete('/api/users/me/avatar/'),
+        }
+        for label, change in changes.items():
+            with self.subTest(label):
+                self.assertEqual(self.misses_after(change), 0)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.check_password('Zx9!qwerty'))
+        self.assertEqual(self.author.avatar.name, 'users/avatars/default.png')
+
+
+class TagFilterTests(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        breakfast, lunch = cls.tags
+        dinner = Tag.objects.create(name='Ужин', color='#8775D2',
+                                    slug='dinner')
+        cls.recipes = {
+            name: create_recipe(cls.author, name, tags).id
+            for name, tags in (
+                ('all', (breakfast, lunch, dinner)),
+                ('two', (breakfast, lunch)),
+                ('breakfast', (breakfast,)),
+                ('dinner', (dinner,)),
+                ('none', ()),
+            )
+        }
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?limit=50&{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        ids = [item['id'] for item in data['results']]
+        self.assertEqual(data['count'], len(ids))
+        return ids
+
+    def test_recipes_with_several_tags_are_not_repeated(self):
+        tags = 'tags=breakfast&tags=lunch&tags=dinner'
+        expected = {
+            'any': {'all', 'two', 'breakfast', 'dinner'},
+            'all': {'all'},
+        }
+        for fast in (True, False):
+            for mode, names in expected.items():
+                with self.subTest(fast=fast, mode=mode):
+                    with override_settings(API_FAST_READ_PATH=fast):
+                        ids = self.get_ids(f'{tags}&tags_match={mode}')
+                    self.assertEqual(len(ids), len(set(ids)))
+                    self.assertEqual(
+                        set(ids), {self.recipes[name] for name in names}
+                    )
+
+    def test_default_mode_is_any(self):
+        self.assertEqual(
+            set(self.get_ids('tags=breakfast&tags=lunch')),
+            {self.recipes[name] for name in ('all', 'two', 'breakfast')},
+        )
+
+
+class ShoppingCartTests(FoodgramTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ids = [
+            create_recipe(cls.author, f'Рецепт {number}', cls.tags,
+                          cls.ingredients).id
+            for number in range(30)
+        ]
+        cls.missing = cls.ids[-1] + 1000
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def batch(self, method, ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                '/api/recipes/shopping_cart/batch/', {'ids': ids},
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), {
+            item['id']: item['status'] for item in response.json()['results']
+        }
+
+    def test_batch(self):
+        # Число запросов не зависит от числа рецептов в пакете.
+        for size in (5, 30):
+            ids = [*self.ids[:size], self.missing]
+            for method, done, skipped in (
+                ('post', 'added', 'exists'), ('delete', 'removed', 'absent')
+            ):
+                with self.subTest(size=size, method=method):
+                    queries, statuses = self.batch(method, ids)
+                    self.assertLessEqual(queries, 10)
+                    self.assertEqual(statuses, {
+                        **dict.fromkeys(ids[:-1], done),
+                        self.missing: 'not_found',
+                    })
+                    _, statuses = self.batch(method, ids)
+                    self.assertEqual(set(statuses.values()), {
+                        skipped, 'not_found'
+                    })
+                    self.assertEqual(find_drift(), [])
+
+    def test_download(self):
+        self.batch('post', self.ids[:3])
+        rows = list(shopping_list_rows(self.reader))
+        self.assertEqual(rows, list(aggregate_shopping_list(self.reader)))
+        self.assertEqual([row['total'] for row in rows], [300, 300])
+        for file_format, content_type in SHOPPING_LIST_FORMATS.items():
+            with self.subTest(file_format=file_format):
+                response = self.client.get(
+                    '/api/recipes/download_shopping_cart/'
+                    f'?file_format={file_format}'
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response['Content-Type'], content_type)
+                content = b''.join(response)
+                if file_format == 'pdf':
+                    self.assertTrue(content.startswith(b'%PDF'))
+                else:
+                    self.assertIn('Мука', content.decode())
+
+
+class IngredientSearchTests(FoodgramTestCase):
+    """Индекс в памяти ищет так же, как istartswith в БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        call_command('load_ingredients', stdout=StringIO())
+
+    def test_prefixes_match_orm(self):
+        index = ingredient_index.get()
+        names = index.rows[::50]
+        prefixes = sorted({
+            name[:length] for _, name, _ in names for length in (1, 2, 5)
+        })
+        for prefix in [*prefixes, prefixes[-1].upper(), 'нет такого']:
+            with self.subTest(prefix=prefix):
+                self.assertEqual(index.search(prefix), list(
+                    Ingredient.objects.filter(
+                        name__istartswith=prefix
+                    ).values('id', 'name', 'measurement_unit')
+                ))
+
+    def test_startswith_matches_scan(self):
+        rows = [
+            (number, f'{word} {number}', 'г')
+            for number, word in enumerate(
+                ['Мука', 'мука ржаная', 'Масло', 'Соль', 'соус', 'Ёж'] * 50
+            )
+        ]
+        index = IngredientIndex(rows)
+        for prefix in ('м', 'мук', 'мука р', 'с', 'со', 'ё', 'х'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(index.startswith(prefix), [
+                    position for position, (_, name, _) in enumerate(rows)
+                    if name.casefold().startswith(prefix)
+                ])
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTests(FoodgramTestCase):
+    """Лента совпадает с рецептами подписок, в том числе merge on read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.celebrity = create_user('celebrity')
+        cls.other = create_user('other')
+        Subscription.objects.bulk_create([
+            Subscription(user=cls.reader, author=cls.author),
+            Subscription(user=cls.reader, author=cls.celebrity),
+            Subscription(user=cls.other, author=cls.celebrity),
+        ])
+        for number in range(4):
+            for author in (cls.author, cls.celebrity, cls.other):
+                create_recipe(author, f'Рецепт {number}')
+        rebuild()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def feed_ids(self, limit):
+        ids, path = [], f'/api/recipes/feed/?limit={limit}'
+        while path:
+            data = self.client.get(path).json()
+            ids += [item['id'] for item in data['results']]
+            path = data['next']
+        return ids
+
+    def subscription_ids(self):
+        return list(Recipe.objects.filter(
+            author__subscriptions__user=self.reader
+        ).order_by(*KeysetPagination.ordering).values_list('id', flat=True))
+
+    def test_pages_match_subscriptions(self):
+        self.assertEqual(
+            list(MergedFeedAuthor.objects.values_list('author', flat=True)),
+            [self.celebrity.id],
+        )
+        expected = self.subscription_ids()
+        self.assertEqual(len(expected), 8)
+        for limit in (3, 8):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.feed_ids(limit), expected)
+
+    def test_publish_and_follow(self):
+        for author in (self.author, self.celebrity):
+            create_recipe(author, 'Новый рецепт')
+        self.client.post(f'/api/users/{self.other.id}/subscribe/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        expected = self.subscription_ids()
+        self.assertEqual(len(expected), 9)
+        self.assertEqual(self.feed_ids(4), expected)
@@ -1,13 +1,22 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (
+    IngredientViewSet,
+    RecipeDeletionViewSet,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet,
+)
 
 app_name = 'api'
 
 router = DefaultRouter()
 router.register('users', UserViewSet)
 router.register('recipes', RecipeViewSet, basename='recipes')
+router.register(
+    'recipe-deletions', RecipeDeletionViewSet, basename='recipe-deletions'
+)
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 
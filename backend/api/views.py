@@ -1,29 +1,114 @@
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db.models import Count, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
-from api.filters import RecipeFilter
+from api.autocomplete import ingredient_index
+from api.conditional import conditional_get
+from api.fastpath import (
+    RecipeCardReader,
+    RecipeReader,
+    UserReader,
+    newest_per_author,
+)
+from api.filters import (
+    ORDERING_TRENDING,
+    SEARCH_ORDERING,
+    TRENDING_ORDERING,
+    RecipeFilter,
+)
+from api.membership import record_membership
+from api.pagination import KeysetPagination
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from api.relations import delete_link_rows, delete_links, insert_links
 from api.serializers import (
     ChangePasswordSerializer,
     IngredientSerializer,
     RecipeCreateSerializer,
+    RecipeDeletionSerializer,
+    RecipeIdsSerializer,
     RecipeSerializer,
     RecipeShortSerializer,
     TagSerializer,
     UserAvatarSerializer,
     UserCreateSerializer,
     UserSerializer,
+    get_recipes_limit,
+)
+from api.shopping_list import (
+    render_csv,
+    render_pdf,
+    render_text,
+    shopping_list_rows,
+)
+from api.snapshots import (
+    ingredient_snapshot,
+    snapshot_response,
+    tag_snapshot,
+)
+from recipes.counters import LINK_COUNTERS, change_counter
+from recipes.feed import (
+    TIMELINE_ORDERING,
+    follow,
+    merged_recipes,
+    timeline,
+    unfollow,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeDeletion,
+    RecipeIngredient,
+    RecipeSimilarity,
+    ShoppingCart,
+    Tag,
+)
+from recipes.shopping import add_cart_recipes, remove_cart_recipes
+from recipes.trending import (
+    add_recent,
+    current_shift,
+    remove_events,
+    rescale,
 )
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import Subscription, User
 
+# Итоги пакетных операций с избранным и корзиной.
+BATCH_ADDED = 'added'
+BATCH_EXISTS = 'exists'
+BATCH_REMOVED = 'removed'
+BATCH_ABSENT = 'absent'
+BATCH_NOT_FOUND = 'not_found'
+
+SHOPPING_LIST_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def trending_resource(view):
+    # Порядок ?ordering=trending меняется с каждым избранным.
+    return 'trending' if view.is_trending else None
+
+
+def plan_user_queryset(queryset, fields, recipes_limit=None):
+    if 'recipes' in fields:
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time', 'author'
+        ).order_by('-pub_date', '-id')
+        queryset = queryset.prefetch_related(Prefetch(
+            'recipes', queryset=newest_per_author(recipes, recipes_limit)
+        ))
+    return queryset
+
 
 class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
@@ -31,6 +116,17 @@ class TagViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = None
 
+    @conditional_get('tags')
+    def list(self, request, *args, **kwargs):
+        response = snapshot_response(request, tag_snapshot)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return response
+
+    @conditional_get('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
@@ -38,6 +134,22 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     pagination_class = None
 
+    @conditional_get('ingredients')
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.get(request).search(
+                name, settings.INGREDIENT_CONTAINS_FALLBACK
+            ))
+        response = snapshot_response(request, ingredient_snapshot)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return response
+
+    @conditional_get('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_queryset(self):
         name = self.request.query_params.get('name')
         queryset = self.queryset
@@ -52,45 +164,246 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
+    lookup_value_regex = r'\d+'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if (
+                self.action == 'feed'
+                or KeysetPagination.cursor_query_param in params
+                or params.get('pagination') == 'cursor'
+            ):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    @property
+    def is_trending(self):
+        return (
+            self.action == 'list'
+            and self.request.query_params.get('ordering') == ORDERING_TRENDING
+        )
+
+    @property
+    def cursor_ordering(self):
+        if self.is_trending:
+            return TRENDING_ORDERING
+        if self.action == 'list' and self.request.query_params.get('search'):
+            return SEARCH_ORDERING
+        return KeysetPagination.ordering
+
+    @property
+    def cursor_version(self):
+        # Курсор популярности хранит базу затухания, чтобы пережить
+        # renormalize_trending.
+        if not self.is_trending:
+            return None
+        if not hasattr(self, '_cursor_version'):
+            self._cursor_version = current_shift()
+        return self._cursor_version
+
+    def upgrade_cursor(self, values, version):
+        if self.cursor_version is None:
+            raise ValueError('Cursor version is not expected')
+        score, *rest = values
+        return [rescale(score, int(version), self.cursor_version), *rest]
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    def get_read_serializer(self):
+        if not hasattr(self, '_read_serializer'):
+            self._read_serializer = RecipeSerializer(
+                context=self.get_serializer_context()
+            )
+        return self._read_serializer
+
+    def get_author_queryset(self, fields):
+        return plan_user_queryset(
+            User.objects.all(), fields, get_recipes_limit(self.request)
+        )
+
     def get_queryset(self):
-        return Recipe.objects.all().prefetch_related(
-            'tags',
-            'ingredients',
-            'recipe_ingredients',
-        ).select_related('author')
+        fields = self.get_read_serializer().fields
+        queryset = Recipe.objects.all()
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('id'),
+            ))
+        if 'author' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'author',
+                queryset=self.get_author_queryset(fields['author'].fields),
+            ))
+        return queryset
+
+    def get_reader(self):
+        params = self.request.query_params
+        if not (params.get('fields') or params.get('expand')):
+            return RecipeCardReader(self.request)
+        serializer = self.get_read_serializer()
+        author_queryset = None
+        if 'author' in serializer.fields:
+            author_queryset = self.get_author_queryset(
+                serializer.fields['author'].fields
+            )
+        return RecipeReader(self.request, serializer, author_queryset)
+
+    @conditional_get('recipes', trending_resource, personalized=True)
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_READ_PATH:
+            return super().list(request, *args, **kwargs)
+        reader = self.get_reader()
+        queryset = reader.prepare(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.build(page))
+        return Response(reader.build(queryset))
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+    )
+    @conditional_get('recipes', personalized=True)
+    def feed(self, request):
+        # Из ленты и из рецептов авторов merge on read берётся по
+        # page_size + 1 строк за курсором; страницу из их объединения
+        # выбирает обычная keyset-пагинация.
+        paginator = self.paginator
+        user = request.user
+        ids = [
+            *paginator.seek(
+                timeline(user), request, TIMELINE_ORDERING
+            ).values_list('recipe_id', flat=True),
+            *paginator.seek(
+                merged_recipes(user), request, paginator.ordering
+            ).values_list('id', flat=True),
+        ]
+        queryset = self.get_queryset().filter(id__in=ids)
+        if not settings.API_FAST_READ_PATH:
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        reader = self.get_reader()
+        page = self.paginate_queryset(reader.prepare(queryset))
+        return self.get_paginated_response(reader.build(page))
+
+    @action(detail=True, methods=['get'])
+    @conditional_get('recipes', 'similar')
+    def similar(self, request, pk=None):
+        rows = RecipeSimilarity.objects.filter(
+            recipe_id=pk
+        ).select_related('similar').order_by('-score', 'similar_id')
+        recipes = [row.similar for row in rows]
+        if not recipes:
+            get_object_or_404(Recipe, id=pk)
+        serializer = RecipeShortSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @conditional_get('recipes', personalized=True)
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.API_FAST_READ_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        reader = self.get_reader()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            reader.prepare(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(reader.build([row])[0])
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def _handle_m2m_action(self, request, pk, model_class, error_message):
-        recipe = get_object_or_404(Recipe, id=pk)
+        user = request.user
+        recipe_id = int(pk)
         if request.method == 'POST':
-            obj, created = model_class.objects.get_or_create(
-                user=request.user,
-                recipe=recipe,
-            )
-            if not created:
+            if not insert_links(model_class, user.id, 'recipe', [recipe_id]):
+                get_object_or_404(Recipe, id=recipe_id)
                 return Response(
                     {'error': error_message},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            serializer = RecipeShortSerializer(recipe)
+            if model_class is ShoppingCart:
+                add_cart_recipes(user.id, [recipe_id])
+            add_recent(model_class, [recipe_id])
+            change_counter(LINK_COUNTERS[model_class], [recipe_id], 1)
+            record_membership(request, model_class, {recipe_id}, True)
+            serializer = RecipeShortSerializer(
+                Recipe.objects.get(id=recipe_id)
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        obj = get_object_or_404(
-            model_class,
-            user=request.user,
-            recipe=recipe,
+        removed = delete_link_rows(
+            model_class, user.id, 'recipe', [recipe_id], 'created'
         )
-        obj.delete()
+        if not removed:
+            raise Http404
+        if model_class is ShoppingCart:
+            remove_cart_recipes(user.id, [recipe_id])
+        remove_events(model_class, removed)
+        change_counter(LINK_COUNTERS[model_class], [recipe_id], -1)
+        record_membership(request, model_class, {recipe_id}, False)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @transaction.atomic
+    def _handle_m2m_batch(self, request, model_class):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user = request.user
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        present = request.method == 'POST'
+        if present:
+            changed = insert_links(model_class, user.id, 'recipe', found)
+            if changed and model_class is ShoppingCart:
+                add_cart_recipes(user.id, changed)
+            if changed:
+                add_recent(model_class, changed)
+                change_counter(LINK_COUNTERS[model_class], changed, 1)
+            done, skipped = BATCH_ADDED, BATCH_EXISTS
+        else:
+            removed = delete_link_rows(
+                model_class, user.id, 'recipe', found, 'created'
+            )
+            changed = {recipe_id for recipe_id, _ in removed}
+            if changed and model_class is ShoppingCart:
+                remove_cart_recipes(user.id, changed)
+            if changed:
+                remove_events(model_class, removed)
+                change_counter(LINK_COUNTERS[model_class], changed, -1)
+            done, skipped = BATCH_REMOVED, BATCH_ABSENT
+        if changed:
+            record_membership(request, model_class, changed, present)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    done if pk in changed
+                    else skipped if pk in found
+                    else BATCH_NOT_FOUND
+                ),
+            }
+            for pk in ids
+        ]})
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -117,43 +430,120 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'Рецепт уже в списке покупок',
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/batch',
+    )
+    def favorite_batch(self, request):
+        return self._handle_m2m_batch(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self._handle_m2m_batch(request, ShoppingCart)
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        ingredients = (
-            Recipe.objects
-            .filter(in_shopping_cart=request.user)
-            .values(
-                'ingredients__name',
-                'ingredients__measurement_unit'
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'file_format': [
+                    'Доступные форматы: '
+                    + ', '.join(SHOPPING_LIST_FORMATS)
+                ]},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            .annotate(amount=Sum('recipe_ingredients__amount'))
-            .order_by('ingredients__name')
-        )
-
-        shopping_list = (
-            f'Список покупок для: {request.user.get_full_name()}\n\n'
+        user = request.user
+        rows = shopping_list_rows(user)
+        filename = f'{user.username}_shopping_list.{file_format}'
+        if file_format == 'pdf':
+            return FileResponse(
+                render_pdf(user, rows),
+                as_attachment=True,
+                filename=filename,
+                content_type=SHOPPING_LIST_FORMATS[file_format],
+            )
+        if file_format == 'csv':
+            content = render_csv(rows)
+        else:
+            content = render_text(user, rows)
+        response = StreamingHttpResponse(
+            content, content_type=SHOPPING_LIST_FORMATS[file_format]
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredients__name"]} '
-            f'({ingredient["ingredients__measurement_unit"]}) '
-            f'- {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-
-        filename = f'{request.user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
 
+class RecipeDeletionViewSet(mixins.CreateModelMixin,
+                            viewsets.ReadOnlyModelViewSet):
+    """Пакетное удаление рецептов для персонала.
+
+    POST ставит задачу в очередь команды delete_recipes; ход удаления
+    виден в полях status, deleted и total.
+    """
+
+    queryset = RecipeDeletion.objects.select_related('author')
+    serializer_class = RecipeDeletionSerializer
+    permission_classes = [IsAdminUser]
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
         return response
 
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    lookup_value_regex = r'\d+'
+
+    def get_read_serializer(self):
+        if not hasattr(self, '_read_serializer'):
+            self._read_serializer = UserSerializer(
+                context=self.get_serializer_context()
+            )
+        return self._read_serializer
+
+    def get_queryset(self):
+        return plan_user_queryset(
+            User.objects.all(),
+            self.get_read_serializer().fields,
+            get_recipes_limit(self.request),
+        ).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_READ_PATH:
+            return super().list(request, *args, **kwargs)
+        return self._fast_list(self.filter_queryset(self.get_queryset()))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.API_FAST_READ_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        reader = UserReader(request, self.get_read_serializer())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            reader.prepare(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(reader.build([row])[0])
+
+    def _fast_list(self, queryset):
+        reader = UserReader(self.request, self.get_read_serializer())
+        queryset = reader.prepare(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.build(page))
+        return Response(reader.build(queryset))
 
     def create(self, request, *args, **kwargs):
         serializer = UserCreateSerializer(data=request.data)
@@ -173,32 +563,38 @@ class UserViewSet(viewsets.ModelViewSet):
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def subscribe(self, request, pk=None):
-        author = get_object_or_404(User, id=pk)
         user = request.user
+        author_id = int(pk)
 
-        if user == author:
+        if user.id == author_id:
             return Response(
                 {'errors': 'Нельзя подписаться на самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if request.method == 'POST':
-            if author in user.subscriptions.values_list('author', flat=True):
+            if not insert_links(Subscription, user.id, 'author', [author_id]):
+                get_object_or_404(User, id=author_id)
                 return Response(
                     {'errors': 'Вы уже подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            follow(user.id, author_id)
+            change_counter('followers_count', [author_id], 1)
+            record_membership(request, Subscription, {author_id}, True)
 
-            Subscription.objects.create(user=user, author=author)
-
-            serializer = UserSerializer(author, context={'request': request})
+            serializer = UserSerializer(
+                User.objects.get(id=author_id), context={'request': request}
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = get_object_or_404(
-            Subscription, user=user, author=author
-        )
-        subscription.delete()
+        if not delete_links(Subscription, user.id, 'author', [author_id]):
+            raise Http404
+        unfollow(user.id, author_id)
+        change_counter('followers_count', [author_id], -1)
+        record_membership(request, Subscription, {author_id}, False)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -207,12 +603,13 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def subscriptions(self, request):
-        subscriptions = (
-            User.objects.filter(subscriptions__user=request.user)
-            .annotate(recipes_count=Count('recipes'))
-            .prefetch_related('recipes')
-            .order_by('id')
-        )
+        subscriptions = plan_user_queryset(
+            User.objects.filter(subscriptions__user=request.user),
+            self.get_read_serializer().fields,
+            get_recipes_limit(request),
+        ).order_by('id')
+        if settings.API_FAST_READ_PATH:
+            return self._fast_list(subscriptions)
         page = self.paginate_queryset(subscriptions)
         if page is not None:
             serializer = self.get_serializer(
@@ -264,7 +661,7 @@ class UserViewSet(viewsets.ModelViewSet):
             if user.avatar and user.avatar.name != 'users/avatars/default.png':
                 default_storage.delete(user.avatar.name)
                 user.avatar = 'users/avatars/default.png'
-                user.save()
+                user.save(update_fields=['avatar'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         serializer = UserAvatarSerializer(
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -148,6 +149,69 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Кэш карточек рецептов; при нескольких воркерах он должен быть общим,
+# например django.core.cache.backends.redis.RedisCache. Версии ресурсов
+# для ETag и снимков справочников хранятся в БД (recipes.cache).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_CARD_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_CARD_CACHE_TIMEOUT', 60 * 60)
+)
+
+API_FAST_READ_PATH = (
+    os.getenv('API_FAST_READ_PATH', 'True').lower() == 'true'
+)
+
+# Сколько совпадений «по вхождению» добавлять к поиску ингредиентов
+# по началу названия; 0 — только префиксный поиск, как раньше.
+INGREDIENT_CONTAINS_FALLBACK = int(
+    os.getenv('INGREDIENT_CONTAINS_FALLBACK', 0)
+)
+
+# Наборы избранного, корзины и подписок пользователя. Локальный LRU
+# живёт в памяти процесса; для нескольких воркеров нужен
+# api.membership.CacheMembershipBackend поверх общего кэша.
+MEMBERSHIP_CACHE = {
+    'BACKEND': os.getenv(
+        'MEMBERSHIP_CACHE_BACKEND', 'api.membership.LocalMembershipBackend'
+    ),
+    'OPTIONS': {
+        'timeout': int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 5 * 60)),
+    },
+}
+
+# Лента подписок: рецепты авторов, у которых подписчиков больше порога,
+# не раскладываются по лентам при публикации, а подмешиваются при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10_000)
+)
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_FOLLOW_BACKFILL = int(os.getenv('FEED_FOLLOW_BACKFILL', 100))
+
+# Период полураспада популярности рецепта (ordering=trending) в секундах,
+# по умолчанию 3,5 суток.
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', 302_400))
+
+# Похожие рецепты: сколько соседей хранится для рецепта и сколько
+# ненулевых значений допускается в произведении одного блока матриц.
+SIMILAR_RECIPES_TOP_K = int(os.getenv('SIMILAR_RECIPES_TOP_K', 10))
+SIMILAR_RECIPES_BLOCK_ENTRIES = int(
+    os.getenv('SIMILAR_RECIPES_BLOCK_ENTRIES', 20_000_000)
+)
+
+# TTF-шрифт с кириллицей для PDF-версии списка покупок.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost',
     'https://localhost',
@@ -200,3 +264,24 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.AllowAllUsersModelBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
+
+# Списки админки: начиная с такой оценки числа строк COUNT(*) не
+# выполняется, и число строк и страниц показывается приблизительно.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000)
+)
+
+# Рецептов в одной транзакции пакетного удаления (delete_recipes).
+RECIPE_DELETION_BATCH_SIZE = int(
+    os.getenv('RECIPE_DELETION_BATCH_SIZE', 500)
+)
+
+# Ширины вариантов изображений в пикселях (build_image_variants).
+RECIPE_IMAGE_WIDTHS = tuple(
+    int(width)
+    for width in os.getenv('RECIPE_IMAGE_WIDTHS', '320,640,960').split(',')
+)
+AVATAR_IMAGE_WIDTHS = tuple(
+    int(width)
+    for width in os.getenv('AVATAR_IMAGE_WIDTHS', '64,128,256').split(',')
+)
@@ -1,14 +1,27 @@
+from collections import defaultdict
+
 from django.contrib import admin
-from django.db.models import Count
+from django.db.models import Prefetch
 
+from recipes.admin_tools import AutocompleteFilter, LargeTableAdminMixin
+from recipes.counters import change_counter
+from recipes.deletion import create as create_deletion
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
+    RecipeDeletion,
     RecipeIngredient,
     ShoppingCart,
     Tag,
 )
+from recipes.shopping import (
+    add_cart_recipes,
+    add_recipe_ingredients,
+    remove_cart_recipes,
+    remove_recipe_ingredients,
+)
+from recipes.trending import add_events, remove_events
 
 
 @admin.register(Tag)
@@ -20,15 +33,15 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'measurement_unit', 'id')
     search_fields = ('name',)
-    list_filter = ('name',)
     empty_value_display = '-пусто-'
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
     min_num = 1
     extra = 1
     verbose_name = 'Ингредиент'
@@ -36,51 +49,172 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'name',
         'author',
-        'get_favorites_count',
+        'favorites_count',
+        'shopping_cart_count',
         'get_ingredients_display',
     )
-    search_fields = ('name', 'author__username', 'author__email')
-    list_filter = ('tags', 'author', 'name')
+    # Поиск по автору заменяет фильтр; условие по одной таблице
+    # проверяется по индексу recipe_name_upper_trgm_idx.
+    search_fields = ('name',)
+    list_filter = ('tags', ('author', AutocompleteFilter))
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
     inlines = (RecipeIngredientInline,)
+    actions = ('delete_in_batches',)
     empty_value_display = '-пусто-'
 
     def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(
-            favorites_count=Count('in_favorites')
-        )
-
-    def get_favorites_count(self, obj):
-        return obj.favorites_count
-
-    get_favorites_count.short_description = 'В избранном'
+        return super().get_queryset(request).prefetch_related(Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient'
+            ).order_by('ingredient__name'),
+        ))
+
+    def save_model(self, request, obj, form, change):
+        if change and 'author' in form.changed_data:
+            change_counter('recipes_count', [form.initial['author']], -1)
+            change_counter('recipes_count', [obj.author_id], 1)
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        remove_recipe_ingredients(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        add_recipe_ingredients(form.instance.pk)
 
     def get_ingredients_display(self, obj):
         return ', '.join([
-            f'{ingredient.name} - '
-            f'{ingredient.recipe_ingredients.get(recipe=obj).amount}'
-            f' {ingredient.measurement_unit}'
-            for ingredient in obj.ingredients.all()
+            f'{item.ingredient.name} - {item.amount}'
+            f' {item.ingredient.measurement_unit}'
+            for item in obj.recipe_ingredients.all()
         ])
 
     get_ingredients_display.short_description = 'Ингредиенты'
 
+    @admin.action(
+        description='Удалить выбранные рецепты в фоне',
+        permissions=('delete',),
+    )
+    def delete_in_batches(self, request, queryset):
+        # Стандартное удаление собирает и показывает все связанные
+        # объекты, а удаляет их по одному с сигналами.
+        job = create_deletion(
+            request.user,
+            recipe_ids=queryset.prefetch_related(None).values_list(
+                'id', flat=True
+            ),
+        )
+        self.message_user(
+            request,
+            f'Задача удаления №{job.pk}: рецептов {job.total}. '
+            'Её выполнит команда delete_recipes.',
+        )
+
+
+@admin.register(RecipeDeletion)
+class RecipeDeletionAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'status',
+        'deleted',
+        'total',
+        'author',
+        'created_by',
+        'created',
+        'finished',
+    )
+    list_filter = ('status',)
+    list_select_related = ('author', 'created_by')
+    exclude = ('recipe_ids',)
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user', 'recipe')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('recipe', AutocompleteFilter),
+    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = Favorite.objects.get(pk=obj.pk)
+            remove_events(Favorite, [(old.recipe_id, old.created)])
+            change_counter('favorites_count', [old.recipe_id], -1)
+        super().save_model(request, obj, form, change)
+        add_events(Favorite, [(obj.recipe_id, obj.created)])
+        change_counter('favorites_count', [obj.recipe_id], 1)
+
+    def delete_model(self, request, obj):
+        remove_events(Favorite, [(obj.recipe_id, obj.created)])
+        change_counter('favorites_count', [obj.recipe_id], -1)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        events = list(queryset.values_list('recipe', 'created'))
+        remove_events(Favorite, events)
+        change_counter(
+            'favorites_count', [recipe_id for recipe_id, _ in events], -1
+        )
+        super().delete_queryset(request, queryset)
+
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user', 'recipe')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('recipe', AutocompleteFilter),
+    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     empty_value_display = '-пусто-'
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            remove_cart_recipes(old.user_id, [old.recipe_id])
+            remove_events(ShoppingCart, [(old.recipe_id, old.created)])
+            change_counter('shopping_cart_count', [old.recipe_id], -1)
+        super().save_model(request, obj, form, change)
+        add_cart_recipes(obj.user_id, [obj.recipe_id])
+        add_events(ShoppingCart, [(obj.recipe_id, obj.created)])
+        change_counter('shopping_cart_count', [obj.recipe_id], 1)
+
+    def delete_model(self, request, obj):
+        remove_cart_recipes(obj.user_id, [obj.recipe_id])
+        remove_events(ShoppingCart, [(obj.recipe_id, obj.created)])
+        change_counter('shopping_cart_count', [obj.recipe_id], -1)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipes = defaultdict(list)
+        events = []
+        for user_id, recipe_id, created in queryset.values_list(
+            'user', 'recipe', 'created'
+        ):
+            recipes[user_id].append(recipe_id)
+            events.append((recipe_id, created))
+        for user_id, recipe_ids in recipes.items():
+            remove_cart_recipes(user_id, recipe_ids)
+        remove_events(ShoppingCart, events)
+        change_counter(
+            'shopping_cart_count', [recipe_id for recipe_id, _ in events], -1
+        )
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,88 @@
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import ResourceVersion
+
+# Увеличивается при изменении формы карточки рецепта.
+CARD_VERSION = 2
+
+card_stats = Counter()
+
+
+def card_key(recipe_id, version):
+    # card_version рецепта хранится в его строке и меняется при любой
+    # правке карточки, в том числе из команд в других процессах, поэтому
+    # старые карточки не удаляются, а перестают читаться и вытесняются
+    # по таймауту.
+    return f'recipe-card:{CARD_VERSION}:{recipe_id}:{version}'
+
+
+def get_cards(versions):
+    """Карточки из кэша по {id рецепта: card_version}."""
+    keys = {
+        card_key(recipe_id, version): recipe_id
+        for recipe_id, version in versions.items()
+    }
+    cached = cache.get_many(keys)
+    card_stats['hits'] += len(cached)
+    card_stats['misses'] += len(keys) - len(cached)
+    return {keys[key]: card for key, card in cached.items()}
+
+
+def set_cards(cards, versions):
+    cache.set_many(
+        {
+            card_key(recipe_id, versions[recipe_id]): card
+            for recipe_id, card in cards.items()
+        },
+        timeout=settings.RECIPE_CARD_CACHE_TIMEOUT,
+    )
+
+
+def bump_cards(recipes):
+    """Новая версия карточек рецептов из queryset recipes."""
+    recipes.update(card_version=F('card_version') + 1)
+
+
+def new_version(name):
+    return ResourceVersion(
+        name=name, version=uuid.uuid4().hex, modified=timezone.now()
+    )
+
+
+def get_versions(resources):
+    """Версия и время изменения для каждого ресурса.
+
+    Версия — случайный токен, а не счётчик. Строка ресурса создаётся
+    при первом чтении.
+    """
+    query = ResourceVersion.objects.values_list('name', 'version', 'modified')
+    rows = list(query.filter(name__in=resources))
+    missing = set(resources) - {name for name, _, _ in rows}
+    if missing:
+        ResourceVersion.objects.bulk_create(
+            [new_version(name) for name in sorted(missing)],
+            ignore_conflicts=True,
+        )
+        rows += query.filter(name__in=missing)
+    return {
+        name: (version, modified.timestamp())
+        for name, version, modified in rows
+    }
+
+
+def bump_versions(*resources):
+    # После коммита и отдельным запросом: строку ресурса меняют почти
+    # все записи, и блокировка не должна держаться до конца транзакции.
+    transaction.on_commit(lambda: ResourceVersion.objects.bulk_create(
+        [new_version(name) for name in sorted(set(resources))],
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=['version', 'modified'],
+    ))
@@ -0,0 +1,199 @@
+"""Хранимые счётчики рецептов и пользователей.
+
+Счётчик меняется в той же транзакции, что и связь, которую он считает.
+Строку, уже заблокированную другой транзакцией (популярный рецепт, за
+которым стоят десятки добавлений в избранное), запрос не ждёт:
+SKIP LOCKED пропускает её, и изменение записывается строкой
+CounterDelta. consolidate переносит такие строки в счётчики; до этого
+значение популярного рецепта может отставать на несколько изменений.
+"""
+from django.db import connection, transaction
+
+from recipes.models import CounterDelta, Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+DELTAS = CounterDelta._meta.db_table
+
+# Счётчик: (модель со счётчиком, модель связей, поле связи).
+COUNTERS = {
+    'favorites_count': (Recipe, Favorite, 'recipe'),
+    'shopping_cart_count': (Recipe, ShoppingCart, 'recipe'),
+    'recipes_count': (User, Recipe, 'author'),
+    'followers_count': (User, Subscription, 'author'),
+}
+LINK_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+# Связи, которые каскадно удаляются вместе с пользователем.
+USER_COUNTERS = ('favorites_count', 'shopping_cart_count', 'followers_count')
+
+CHANGE_SQL = """
+    WITH change AS (
+        SELECT object_id, SUM(delta) AS delta
+        FROM unnest(%(objects)s::bigint[], %(deltas)s::integer[])
+            AS change(object_id, delta)
+        GROUP BY object_id
+        HAVING SUM(delta) <> 0
+    ), locked AS (
+        SELECT {pk} FROM {table}
+        WHERE {pk} IN (SELECT object_id FROM change)
+        ORDER BY {pk}
+        FOR NO KEY UPDATE SKIP LOCKED
+    ), updated AS (
+        UPDATE {table} AS counter
+        SET {column} = counter.{column} + change.delta
+        FROM change
+        WHERE counter.{pk} = change.object_id
+            AND counter.{pk} IN (SELECT {pk} FROM locked)
+        RETURNING counter.{pk}
+    )
+    INSERT INTO {deltas} (counter, object_id, delta)
+    SELECT %(counter)s, object_id, delta FROM change
+    WHERE object_id NOT IN (SELECT {pk} FROM updated)
+"""
+
+CONSOLIDATE_SQL = """
+    WITH locked AS (
+        SELECT {pk} FROM {table}
+        WHERE {pk} IN (
+            SELECT object_id FROM {deltas} WHERE counter = %(counter)s
+        )
+        ORDER BY {pk}
+        FOR NO KEY UPDATE SKIP LOCKED
+    ), moved AS (
+        DELETE FROM {deltas}
+        WHERE counter = %(counter)s
+            AND object_id IN (SELECT {pk} FROM locked)
+        RETURNING object_id, delta
+    )
+    UPDATE {table} AS counter
+    SET {column} = counter.{column} + moved.delta
+    FROM (
+        SELECT object_id, SUM(delta) AS delta FROM moved GROUP BY object_id
+    ) AS moved
+    WHERE counter.{pk} = moved.object_id
+"""
+
+# Изменения объектов, удалённых до consolidate.
+ORPHANS_SQL = """
+    DELETE FROM {deltas} AS pending
+    WHERE counter = %(counter)s AND NOT EXISTS (
+        SELECT 1 FROM {table} WHERE {pk} = pending.object_id
+    )
+"""
+
+# Один запрос видит счётчики, отложенные изменения и связи в одном
+# снимке, а счётчик меняется в транзакции связи, поэтому под нагрузкой
+# расхождений нет.
+DRIFT_SQL = """
+    SELECT
+        counter.{pk},
+        COALESCE(source.total, 0),
+        counter.{column} + COALESCE(pending.delta, 0)
+    FROM {table} AS counter
+    LEFT JOIN (
+        SELECT {key} AS object_id, COUNT(*) AS total
+        FROM {source} GROUP BY {key}
+    ) AS source ON source.object_id = counter.{pk}
+    LEFT JOIN (
+        SELECT object_id, SUM(delta) AS delta
+        FROM {deltas} WHERE counter = %(counter)s GROUP BY object_id
+    ) AS pending ON pending.object_id = counter.{pk}
+    WHERE COALESCE(source.total, 0)
+        <> counter.{column} + COALESCE(pending.delta, 0)
+    ORDER BY counter.{pk}
+"""
+
+LOCK_SQL = """
+    SELECT {pk} FROM {table} WHERE {pk} = ANY(%(objects)s)
+    ORDER BY {pk}
+    FOR NO KEY UPDATE
+"""
+
+# Отложенные изменения удаляются в том же снимке, в котором
+# считаются связи.
+RECOUNT_SQL = """
+    WITH moved AS (
+        DELETE FROM {deltas}
+        WHERE counter = %(counter)s AND object_id = ANY(%(objects)s)
+    )
+    UPDATE {table} AS counter
+    SET {column} = (
+        SELECT COUNT(*) FROM {source} WHERE {key} = counter.{pk}
+    )
+    WHERE counter.{pk} = ANY(%(objects)s)
+"""
+
+
+def _sql(template, counter):
+    model, links, field = COUNTERS[counter]
+    opts = model._meta
+    return template.format(
+        table=opts.db_table,
+        pk=opts.pk.column,
+        column=opts.get_field(counter).column,
+        source=links._meta.db_table,
+        key=links._meta.get_field(field).column,
+        deltas=DELTAS,
+    )
+
+
+def change_counter(counter, object_ids, delta):
+    """Прибавляет delta к счётчику каждого объекта из object_ids.
+
+    id могут повторяться: изменения одного объекта складываются.
+    """
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(CHANGE_SQL, counter), {
+            'counter': counter,
+            'objects': object_ids,
+            'deltas': [delta] * len(object_ids),
+        })
+
+
+def remove_user_links(user_id):
+    """Вычитает связи пользователя, которые удалит каскад."""
+    for counter in USER_COUNTERS:
+        _, links, field = COUNTERS[counter]
+        change_counter(counter, links.objects.filter(
+            user_id=user_id
+        ).values_list(field, flat=True), -1)
+
+
+def consolidate():
+    """Переносит отложенные изменения в счётчики.
+
+    Возвращает {счётчик: число обновлённых объектов}. Изменения строк,
+    заблокированных в момент запуска, остаются до следующего запуска.
+    """
+    updated = {}
+    for counter in COUNTERS:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(_sql(CONSOLIDATE_SQL, counter), {
+                'counter': counter,
+            })
+            updated[counter] = cursor.rowcount
+            cursor.execute(_sql(ORPHANS_SQL, counter), {'counter': counter})
+    return updated
+
+
+def find_drift(counter):
+    """Строки (id объекта, число связей, счётчик с отложенными)."""
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(DRIFT_SQL, counter), {'counter': counter})
+        return cursor.fetchall()
+
+
+@transaction.atomic
+def recount(counter, object_ids):
+    """Пересчитывает счётчик объектов по связям."""
+    params = {'counter': counter, 'objects': list(object_ids)}
+    with connection.cursor() as cursor:
+        # Блокировка до снимка пересчёта: связи, записанные после неё,
+        # попадут в CounterDelta и останутся для consolidate.
+        cursor.execute(_sql(LOCK_SQL, counter), params)
+        cursor.execute(_sql(RECOUNT_SQL, counter), params)
@@ -0,0 +1,148 @@
+"""Пакетное удаление рецептов.
+
+Рецепты задачи RecipeDeletion удаляются пакетами по возрастанию id,
+каждый пакет в своей транзакции вместе с отметкой прогресса. Связанные
+строки удаляются одним запросом на таблицу вместо каскада Django по
+объектам, а то, что при удалении одного рецепта делают сигналы (суммы
+списков покупок, счётчики авторов, кэш карточек), выполняется для всего
+пакета сразу. Файлы изображений и их вариантов ставятся в очередь
+recipes.media.
+
+Задачу одновременно выполняет один процесс: её держит сессионная
+advisory-блокировка, которая снимается и при обрыве соединения.
+"""
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from recipes.cache import bump_versions
+from recipes.counters import change_counter
+from recipes.images import variant_names
+from recipes.media import queue_files
+from recipes.models import Recipe, RecipeDeletion
+from recipes.shopping import remove_recipes_ingredients
+
+RECIPES = Recipe._meta.db_table
+# Первый ключ advisory-блокировки задачи, второй — её id.
+DELETION_LOCK = 0x64656c
+
+DELETE_SQL = 'DELETE FROM {table} WHERE {column} = ANY(%s)'
+
+
+def dependents():
+    """(таблица, колонка) строк, которые ссылаются на рецепт.
+
+    Включает промежуточные таблицы ManyToManyField. Эти строки сами
+    не должны иметь зависимых: их удаление не каскадируется дальше.
+    """
+    tables = []
+    for relation in Recipe._meta.get_fields(include_hidden=True):
+        if not (relation.auto_created and relation.is_relation
+                and not relation.concrete):
+            continue
+        if relation.on_delete is not models.CASCADE:
+            raise ValueError(
+                f'{relation.related_model.__name__}.{relation.field.name}: '
+                'пакетное удаление поддерживает только CASCADE'
+            )
+        tables.append((
+            relation.related_model._meta.db_table, relation.field.column
+        ))
+    return tables
+
+
+def recipes(job):
+    if job.author_id is not None:
+        return Recipe.objects.filter(author_id=job.author_id)
+    return Recipe.objects.filter(id__in=job.recipe_ids)
+
+
+def create(created_by, author_id=None, recipe_ids=None):
+    """Создаёт задачу удаления рецептов автора или списка id."""
+    if recipe_ids is not None:
+        recipe_ids = sorted(set(recipe_ids))
+    job = RecipeDeletion(
+        created_by=created_by, author_id=author_id, recipe_ids=recipe_ids
+    )
+    job.total = recipes(job).count()
+    job.save()
+    return job
+
+
+def resumable():
+    """Новые задачи и задачи, прерванные во время выполнения."""
+    return RecipeDeletion.objects.filter(status__in=(
+        RecipeDeletion.Status.PENDING, RecipeDeletion.Status.RUNNING
+    )).order_by('id')
+
+
+@transaction.atomic
+def delete_batch(job, size):
+    """Удаляет следующие size рецептов задачи; возвращает их число."""
+    rows = list(
+        recipes(job).filter(id__gt=job.last_id).order_by('id')
+        .select_for_update()
+        .values_list('id', 'author_id', 'image', 'image_variants')[:size]
+    )
+    if not rows:
+        return 0
+    ids, authors, images, variants = (list(column) for column in zip(*rows))
+    # Суммы считаются по строкам корзины и составу рецептов, поэтому
+    # вычитаются до их удаления.
+    remove_recipes_ingredients(ids)
+    with connection.cursor() as cursor:
+        for table, column in [*dependents(), (RECIPES, 'id')]:
+            cursor.execute(
+                DELETE_SQL.format(table=table, column=column), [ids]
+            )
+    change_counter('recipes_count', authors, -1)
+    queue_files([
+        *images, *(name for item in variants for name in variant_names(item))
+    ])
+    bump_versions('recipes')
+    job.last_id = ids[-1]
+    job.deleted += len(ids)
+    job.save(update_fields=['last_id', 'deleted'])
+    return len(ids)
+
+
+def _save_status(job, status, **fields):
+    job.status = status
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=['status', *fields])
+
+
+def run(job, size, progress=None):
+    """Выполняет задачу с места остановки.
+
+    progress вызывается с задачей после каждого пакета. Возвращает
+    False, если задачу уже выполняет другой процесс. Ошибка пакета
+    откатывает только его; задача получает состояние FAILED.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_try_advisory_lock(%s, %s)', [DELETION_LOCK, job.pk]
+        )
+        if not cursor.fetchone()[0]:
+            return False
+    try:
+        job.refresh_from_db()
+        if job.status == RecipeDeletion.Status.DONE:
+            return True
+        _save_status(job, RecipeDeletion.Status.RUNNING, error='')
+        try:
+            while delete_batch(job, size):
+                if progress is not None:
+                    progress(job)
+        except Exception as error:
+            _save_status(job, RecipeDeletion.Status.FAILED, error=str(error))
+            raise
+        _save_status(
+            job, RecipeDeletion.Status.DONE, finished=timezone.now()
+        )
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_unlock(%s, %s)', [DELETION_LOCK, job.pk]
+            )
+    return True
@@ -0,0 +1,131 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепты обычных авторов при публикации раскладываются в TimelineEntry
+каждого подписчика (fan-out on write). Автор, у которого подписчиков
+больше FEED_FANOUT_MAX_FOLLOWERS, попадает в MergedFeedAuthor: его
+рецепты не раскладываются, а подмешиваются при чтении ленты
+(merge on read). Обратно автор переводится только командой
+rebuild_feeds.
+"""
+from django.conf import settings
+from django.db import connection
+
+from recipes.models import MergedFeedAuthor, Recipe, TimelineEntry
+from users.models import Subscription
+
+TIMELINE = TimelineEntry._meta.db_table
+MERGED = MergedFeedAuthor._meta.db_table
+RECIPES = Recipe._meta.db_table
+SUBSCRIPTIONS = Subscription._meta.db_table
+
+# Порядок записей ленты; по позициям совпадает с KeysetPagination.
+TIMELINE_ORDERING = ('-pub_date', '-recipe_id')
+
+FAN_OUT_SQL = f"""
+    INSERT INTO {TIMELINE} (user_id, recipe_id, author_id, pub_date)
+    SELECT subscription.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {RECIPES} recipe
+    JOIN {SUBSCRIPTIONS} subscription
+        ON subscription.author_id = recipe.author_id
+    WHERE recipe.id = %s
+    ON CONFLICT DO NOTHING
+"""
+
+BACKFILL_SQL = f"""
+    INSERT INTO {TIMELINE} (user_id, recipe_id, author_id, pub_date)
+    SELECT %s, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {RECIPES} recipe
+    WHERE recipe.author_id = %s
+    ORDER BY recipe.pub_date DESC, recipe.id DESC
+    LIMIT %s
+    ON CONFLICT DO NOTHING
+"""
+
+REBUILD_MERGED_SQL = f"""
+    INSERT INTO {MERGED} (author_id)
+    SELECT author_id FROM {SUBSCRIPTIONS}
+    GROUP BY author_id
+    HAVING COUNT(*) > %s
+"""
+
+REBUILD_TIMELINE_SQL = f"""
+    INSERT INTO {TIMELINE} (user_id, recipe_id, author_id, pub_date)
+    SELECT subscription.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM (
+        SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+        ) AS position
+        FROM {RECIPES}
+    ) recipe
+    JOIN {SUBSCRIPTIONS} subscription
+        ON subscription.author_id = recipe.author_id
+    WHERE recipe.position <= %s
+        AND NOT EXISTS (
+            SELECT 1 FROM {MERGED} merged
+            WHERE merged.author_id = recipe.author_id
+        )
+"""
+
+
+def is_merged(author_id):
+    return MergedFeedAuthor.objects.filter(author_id=author_id).exists()
+
+
+def fan_out_recipe(recipe):
+    if is_merged(recipe.author_id):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(FAN_OUT_SQL, [recipe.id])
+
+
+def follow(user_id, author_id):
+    """Переводит автора в merge on read или копирует его новые рецепты.
+
+    Подписчиков считаем не дальше порога, поэтому подсчёт ограничен
+    даже для популярных авторов.
+    """
+    if is_merged(author_id):
+        return
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    followers = Subscription.objects.filter(
+        author_id=author_id
+    ).values('id')[:limit + 1].count()
+    if followers > limit:
+        MergedFeedAuthor.objects.bulk_create(
+            [MergedFeedAuthor(author_id=author_id)], ignore_conflicts=True
+        )
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            BACKFILL_SQL,
+            [user_id, author_id, settings.FEED_FOLLOW_BACKFILL],
+        )
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+
+
+def timeline(user):
+    return TimelineEntry.objects.filter(user=user)
+
+
+def merged_recipes(user):
+    return Recipe.objects.filter(author_id__in=Subscription.objects.filter(
+        user=user, author__merged_feed__isnull=False
+    ).values('author_id'))
+
+
+def rebuild():
+    """Пересчитывает авторов merge on read и заново раскладывает ленты."""
+    MergedFeedAuthor.objects.all().delete()
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            REBUILD_MERGED_SQL, [settings.FEED_FANOUT_MAX_FOLLOWERS]
+        )
+        cursor.execute(
+            REBUILD_TIMELINE_SQL, [settings.FEED_FOLLOW_BACKFILL]
+        )
@@ -2,9 +2,12 @@ import base64
 import uuid
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 
 from rest_framework import serializers
 
+from recipes.images import srcset
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
@@ -17,3 +20,30 @@ class Base64ImageField(serializers.ImageField):
                 name=f'{id}.{ext}'
             )
         return super().to_internal_value(data)
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """Варианты изображения: {формат: 'url 320w, url 640w'}.
+
+    Пока варианты не собраны, отдаёт {}; URL строятся как у ImageField.
+    """
+
+    def __init__(self, image_field, variants_field, **kwargs):
+        self.image_field = image_field
+        self.variants_field = variants_field
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, instance):
+        return srcset(
+            getattr(instance, self.variants_field),
+            getattr(instance, self.image_field).name,
+            self.to_url,
+        )
@@ -0,0 +1,111 @@
+"""Уменьшенные варианты изображений в WebP и JPEG.
+
+Варианты записываются в JSON-поле рядом с полем изображения:
+{'source': путь исходника, 'webp': [[ширина, путь], ...], 'jpeg': ...}.
+Запись без форматов означает, что исходник не удалось прочитать. Если
+source не совпадает с текущим путём изображения, варианты устарели:
+их пересоберёт команда build_image_variants, а до тех пор API отдаёт
+только исходный URL.
+
+render выполняется в процессах пула и не обращается к БД.
+"""
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.lookups import Exact, IsNull
+from PIL import Image, ImageOps
+
+# Порядок <source> в <picture>: первый поддерживаемый формат выигрывает.
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIRECTORY = 'variants'
+
+
+def outdated(field, variants_field):
+    """Условие на непустое изображение без актуальных вариантов.
+
+    Используется и как условие частичного индекса, поэтому записано
+    без параметров, зависящих от запроса.
+    """
+    source = KeyTextTransform('source', variants_field)
+    return (
+        Q(**{f'{field}__isnull': False}) & ~Q(**{field: ''})
+        & (Q(IsNull(source, True)) | ~Q(Exact(source, F(field))))
+    )
+
+
+def variant_names(variants):
+    """Пути файлов всех вариантов записи."""
+    return [
+        name
+        for fmt in FORMATS
+        for _, name in variants.get(fmt, ())
+    ]
+
+
+def srcset(variants, name, to_url):
+    """{формат: 'url 320w, url 640w'} для актуальных вариантов name."""
+    if not name or variants.get('source') != name:
+        return {}
+    return {
+        fmt: ', '.join(
+            f'{to_url(path)} {width}w' for width, path in variants[fmt]
+        )
+        for fmt in FORMATS
+        if variants.get(fmt)
+    }
+
+
+def _flatten(image):
+    """RGB на белом фоне для форматов без прозрачности."""
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(name, widths):
+    """Сохраняет варианты изображения name; возвращает их запись.
+
+    Ширины больше исходной заменяются исходной, поэтому маленькое
+    изображение получает один вариант без увеличения.
+    """
+    variants = {'source': name}
+    try:
+        with default_storage.open(name) as file, Image.open(file) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе, не меньше
+            # наибольшей ширины по обеим сторонам.
+            image.draft('RGB', (max(widths), max(widths)))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        return variants
+    alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    sources = {
+        'webp': image.convert('RGBA' if alpha else 'RGB'),
+        'jpeg': _flatten(image),
+    }
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    directory = posixpath.join(posixpath.dirname(name), VARIANTS_DIRECTORY)
+    for fmt, (pil_format, params) in FORMATS.items():
+        variants[fmt] = []
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = max(round(image.height * width / image.width), 1)
+            buffer = io.BytesIO()
+            sources[fmt].resize(
+                (width, height), Image.Resampling.LANCZOS
+            ).save(buffer, pil_format, **params)
+            path = default_storage.save(
+                posixpath.join(directory, f'{stem}-{width}.{fmt}'),
+                ContentFile(buffer.getvalue()),
+            )
+            variants[fmt].append([width, path])
+    return variants
@@ -0,0 +1,22 @@
+class ManagedFieldsMixin:
+    """save() существующей строки без update_fields не пишет managed_fields.
+
+    Эти поля меняются запросами UPDATE в обход экземпляров (счётчики,
+    варианты изображений), поэтому значение в загруженном объекте может
+    устареть и затереть их.
+    """
+
+    managed_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert') and not self._state.adding
+        ):
+            skipped = {*self.managed_fields, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+                and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
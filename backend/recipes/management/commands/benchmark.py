@@ -0,0 +1,649 @@
+import io
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from api.autocomplete import CONTAINS_MIN_LENGTH, IngredientIndex
+from api.pagination import KeysetPagination
+from api.serializers import RecipeSerializer
+from api.shopping_list import (
+    aggregate_shopping_list,
+    render_csv,
+    render_pdf,
+    render_text,
+    shopping_list_rows,
+)
+from api.views import RecipeViewSet, UserViewSet
+from recipes.cache import bump_cards, bump_versions
+from recipes.feed import (
+    TIMELINE_ORDERING,
+    merged_recipes,
+    rebuild,
+    timeline,
+)
+from recipes.images import render, variant_names
+from recipes.models import (
+    Ingredient,
+    MergedFeedAuthor,
+    Recipe,
+    ShoppingCart,
+    TimelineEntry,
+)
+from recipes.shopping import rebuild_users
+from recipes.variants import TARGETS, save_variants
+from users.models import Subscription, User
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[6, 50, 500]
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--user',
+            help='Email of the user to personalize responses for',
+        )
+        parser.add_argument(
+            '--catalogue',
+            type=int,
+            default=1_000_000,
+            help='Size of the synthetic ingredient catalogue',
+        )
+        parser.add_argument(
+            '--feed-users',
+            type=int,
+            default=100_000,
+            help='Synthetic readers in the feed scenario',
+        )
+        parser.add_argument(
+            '--feed-authors',
+            type=int,
+            default=20_000,
+            help='Readers that also publish recipes in the feed scenario',
+        )
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=200,
+            help='Authors every reader follows in the feed scenario',
+        )
+        parser.add_argument(
+            '--celebrities',
+            type=int,
+            default=3,
+            help='Authors followed by every reader in the feed scenario',
+        )
+        parser.add_argument(
+            '--feed-recipes',
+            type=int,
+            default=1,
+            help='Recipes per author in the feed scenario',
+        )
+        parser.add_argument(
+            '--card-width',
+            type=int,
+            default=363,
+            help='CSS width of a feed card in the images scenario',
+        )
+
+    scenarios = {
+        'cart': 'bench_cart',
+        'feed': 'bench_feed',
+        'images': 'bench_images',
+        'ingredients': 'bench_ingredients',
+        'serializers': 'bench_serializers',
+    }
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.user = None
+        if options['user']:
+            self.user = User.objects.filter(email=options['user']).first()
+            if self.user is None:
+                raise CommandError(f'User {options["user"]} not found')
+        getattr(self, self.scenarios[options['scenario']])()
+
+    def measure(self, func):
+        timings = []
+        result = None
+        for _ in range(self.options['repeat']):
+            started = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, result
+
+    def report(self, label, size, milliseconds):
+        self.stdout.write(f'{label:<24} n={size:<6} {milliseconds:9.2f} ms')
+
+    def make_view(self, viewset, path, action):
+        request = APIRequestFactory().get(path)
+        if self.user is not None:
+            force_authenticate(request, user=self.user)
+        view = viewset(
+            action_map={'get': action}, format_kwarg=None, kwargs={}
+        )
+        view.request = view.initialize_request(request)
+        return view
+
+    def bench_serializers(self):
+        renderer = JSONRenderer()
+        available = Recipe.objects.count()
+        for size in self.options['sizes']:
+            if size > available:
+                self.stdout.write(self.style.WARNING(
+                    f'n={size}: only {available} recipes in the database'
+                ))
+            view = self.make_view(RecipeViewSet, '/api/recipes/', 'list')
+            queryset = view.get_queryset()
+            reader = view.get_reader()
+
+            def drf_path():
+                return renderer.render(RecipeSerializer(
+                    queryset[:size],
+                    many=True,
+                    context=view.get_serializer_context(),
+                ).data)
+
+            def fast_path():
+                rows = reader.prepare(queryset)[:size]
+                return renderer.render(reader.build(rows))
+
+            drf_time, drf_body = self.measure(drf_path)
+            fast_time, fast_body = self.measure(fast_path)
+            if drf_body != fast_body:
+                raise CommandError(f'n={size}: fast path output differs')
+            self.report('RecipeSerializer', size, drf_time)
+            self.report('RecipeReader', size, fast_time)
+            self.stdout.write(
+                f'{"speedup":<24} n={size:<6} {drf_time / fast_time:9.2f}x'
+            )
+
+    def call_view(self, viewset, actions, method, path, data, **kwargs):
+        request = getattr(APIRequestFactory(), method)(
+            path, data, format='json'
+        )
+        force_authenticate(request, user=self.user)
+        response = viewset.as_view(actions)(request, **kwargs)
+        if response.status_code >= 400:
+            raise CommandError(f'{method} {path}: {response.status_code}')
+        return response
+
+    def bench_cart(self):
+        user = self.user or User.objects.first()
+        if user is None:
+            raise CommandError('No users in the database')
+        available = Recipe.objects.count()
+
+        def legacy_path():
+            # Прежний запрос вьюсета: от Recipe через LEFT JOIN состава.
+            return list(
+                Recipe.objects.filter(in_shopping_cart=user)
+                .values('ingredients__name', 'ingredients__measurement_unit')
+                .annotate(total=Sum('recipe_ingredients__amount'))
+                .order_by('ingredients__name')
+            )
+
+        def aggregate_path():
+            return list(aggregate_shopping_list(user))
+
+        def rows_path():
+            return list(shopping_list_rows(user))
+
+        def text_path():
+            return ''.join(render_text(user, shopping_list_rows(user)))
+
+        def csv_path():
+            return ''.join(render_csv(shopping_list_rows(user)))
+
+        def pdf_path():
+            return render_pdf(user, shopping_list_rows(user)).getvalue()
+
+        for size in self.options['sizes']:
+            if size > available:
+                self.stdout.write(self.style.WARNING(
+                    f'n={size}: only {available} recipes in the database'
+                ))
+            with transaction.atomic():
+                ShoppingCart.objects.filter(user=user).delete()
+                ShoppingCart.objects.bulk_create(
+                    ShoppingCart(user=user, recipe_id=recipe_id)
+                    for recipe_id in Recipe.objects.order_by(
+                        '-pub_date', '-id'
+                    ).values_list('id', flat=True)[:size]
+                )
+                rebuild_users([user.id])
+                legacy_time, legacy = self.measure(legacy_path)
+                aggregate_time, aggregate = self.measure(aggregate_path)
+                rows_time, rows = self.measure(rows_path)
+                text_time, _ = self.measure(text_path)
+                csv_time, _ = self.measure(csv_path)
+                pdf_time, pdf = self.measure(pdf_path)
+                transaction.set_rollback(True)
+            totals = {
+                (row['name'], row['measurement_unit']): row['total']
+                for row in rows
+            }
+            wrong = sum(
+                totals.get((
+                    row['ingredients__name'],
+                    row['ingredients__measurement_unit'],
+                )) != row['total']
+                for row in legacy
+            )
+            self.report('legacy query', size, legacy_time)
+            if aggregate != rows:
+                raise CommandError(f'n={size}: shopping list totals drifted')
+            self.report('grouped query', size, aggregate_time)
+            self.report('totals table', size, rows_time)
+            self.report('txt stream', size, text_time)
+            self.report('csv stream', size, csv_time)
+            self.report('pdf', size, pdf_time)
+            self.stdout.write(
+                f'{"lines":<24} n={size:<6} {len(rows):9} '
+                f'({wrong} differ in legacy, pdf {len(pdf) // 1024} KiB)'
+            )
+
+    def bench_ingredients(self):
+        with open('data/ingredients.json', 'r', encoding='utf-8') as file:
+            names = [item['name'] for item in json.load(file)]
+        rng = random.Random(0)
+        prefixes = sorted({
+            name[:length] for name in names for length in (1, 2, 3)
+        })
+        fields = ('id', 'name', 'measurement_unit')
+
+        # Индекс строится прямо из таблицы: снимок ingredient_index
+        # может создать строку версии ресурса, а сценарий ничего не пишет.
+        index = IngredientIndex(Ingredient.objects.values_list(*fields))
+        if not index.rows:
+            raise CommandError('No ingredients, run load_ingredients first')
+
+        def orm_path():
+            return [
+                list(Ingredient.objects.filter(
+                    name__istartswith=prefix
+                ).values(*fields))
+                for prefix in prefixes
+            ]
+
+        def index_path():
+            return [index.search(prefix) for prefix in prefixes]
+
+        orm_time, orm_result = self.measure(orm_path)
+        index_time, index_result = self.measure(index_path)
+        if orm_result != index_result:
+            raise CommandError('Prefix index results differ from the ORM')
+        self.report('ORM istartswith', len(prefixes), orm_time)
+        self.report('IngredientIndex', len(prefixes), index_time)
+
+        words = sorted({word for name in names for word in name.split()})
+        size = self.options['catalogue']
+        rows = [
+            (
+                number,
+                f'{rng.choice(words)} {rng.choice(words).lower()} {number}',
+                'г',
+            )
+            for number in range(size)
+        ]
+        started = time.perf_counter()
+        index = IngredientIndex(rows)
+        self.report(
+            'IngredientIndex build', size,
+            (time.perf_counter() - started) * 1000,
+        )
+        sample = rng.sample(prefixes, min(20, len(prefixes)))
+
+        def scan_path():
+            return [
+                [
+                    position for position, (_, name, _) in enumerate(rows)
+                    if name.casefold().startswith(prefix.casefold())
+                ]
+                for prefix in sample
+            ]
+
+        def prefix_path():
+            return [index.startswith(prefix.casefold()) for prefix in sample]
+
+        needles = [
+            prefix.casefold() for prefix in prefixes
+            if len(prefix) >= CONTAINS_MIN_LENGTH
+        ][:len(sample)]
+
+        def contains_path():
+            return [index.contains(needle, 50) for needle in needles]
+
+        scan_time, scan_result = self.measure(scan_path)
+        prefix_time, prefix_result = self.measure(prefix_path)
+        if scan_result != prefix_result:
+            raise CommandError('Prefix index results differ from a scan')
+        contains_time, _ = self.measure(contains_path)
+        self.report('linear scan', len(sample), scan_time)
+        self.report('prefix index', len(sample), prefix_time)
+        self.report('contains top-50', len(needles), contains_time)
+
+    def photo(self, seed, width=4032, height=3024):
+        """JPEG размером с фото с телефона: градиент с шумом."""
+        rng = np.random.default_rng(seed)
+        y, x = np.mgrid[0:height, 0:width]
+        pixels = np.stack((
+            x * 255 // width,
+            y * 255 // height,
+            (x + y) * 255 // (width + height),
+        ), axis=-1) + rng.integers(-24, 24, (height, width, 3))
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(
+            buffer, 'JPEG', quality=92
+        )
+        return buffer.getvalue()
+
+    def bench_images(self):
+        """Байты страницы ленты: исходные фото против вариантов.
+
+        Рецептам первой страницы подставляются фото 4032x3024; после
+        сборки вариантов из srcset берётся то, что выбрал бы браузер:
+        наименьший вариант не уже карточки с учётом плотности экрана.
+        """
+        client = APIClient()
+        if self.user is not None:
+            client.force_authenticate(self.user)
+        page = client.get('/api/recipes/').json()['results']
+        recipes = list(Recipe.objects.filter(
+            id__in=[item['id'] for item in page]
+        ).values_list('id', 'image', 'image_variants'))
+        if not recipes:
+            raise CommandError('Need recipes')
+        ids = [pk for pk, _, _ in recipes]
+        names = []
+        try:
+            for seed, (pk, _, _) in enumerate(recipes):
+                names.append(default_storage.save(
+                    'recipes/bench-photo.jpeg', ContentFile(self.photo(seed))
+                ))
+                Recipe.objects.filter(pk=pk).update(
+                    image=names[-1], image_variants={}
+                )
+            bump_cards(Recipe.objects.filter(id__in=ids))
+            bump_versions('recipes')
+            self.report_page_bytes(client, 'before')
+
+            widths = TARGETS[Recipe][2]
+            workers = os.cpu_count()
+            started = time.perf_counter()
+            with ProcessPoolExecutor(
+                workers, multiprocessing.get_context('fork')
+            ) as pool:
+                built = list(pool.map(render, names, [widths] * len(names)))
+            self.report(
+                f'render, {workers} workers', len(names),
+                (time.perf_counter() - started) * 1000,
+            )
+            save_variants(Recipe, [
+                (pk, name, {}) for (pk, _, _), name in zip(recipes, names)
+            ], built)
+            self.report_page_bytes(client, 'after')
+        finally:
+            for variants in Recipe.objects.filter(
+                image__in=names
+            ).values_list('image_variants', flat=True):
+                names += variant_names(variants)
+            for pk, image, variants in recipes:
+                Recipe.objects.filter(pk=pk).update(
+                    image=image, image_variants=variants
+                )
+            bump_cards(Recipe.objects.filter(id__in=ids))
+            bump_versions('recipes')
+            for name in names:
+                default_storage.delete(name)
+
+    def report_page_bytes(self, client, label):
+        response = client.get('/api/recipes/')
+        page = response.json()['results']
+        self.report_bytes(f'page json {label}', len(page), len(
+            response.content
+        ))
+        media = settings.MEDIA_URL
+
+        def size(url):
+            return default_storage.size(url.split(media, 1)[1])
+
+        if label == 'before':
+            self.report_bytes(
+                'original images', len(page),
+                sum(size(item['image']) for item in page),
+            )
+            return
+        for fmt in ('webp', 'jpeg'):
+            for density in (1, 2):
+                needed = self.options['card_width'] * density
+                total = 0
+                for item in page:
+                    candidates = sorted(
+                        (int(width.rstrip('w')), url)
+                        for url, width in (
+                            entry.rsplit(' ', 1)
+                            for entry in item['image_srcset'][fmt].split(', ')
+                        )
+                    )
+                    total += size(next(
+                        (url for width, url in candidates if width >= needed),
+                        candidates[-1][1],
+                    ))
+                self.report_bytes(
+                    f'images {fmt} {density}x', len(page), total
+                )
+
+    def report_bytes(self, label, size, value):
+        self.stdout.write(f'{label:<24} n={size:<6} {value / 1024:9.1f} KB')
+
+    def seed_feed(self):
+        """Читатели, авторы и подписки сценария feed без ORM.
+
+        Первые feed_authors читателей публикуют рецепты. Каждый читатель
+        подписан на celebrities общих авторов и ещё на follows -
+        celebrities авторов из остального пула.
+        """
+        options = self.options
+        authors = options['feed_authors']
+        celebrities = options['celebrities']
+        if not celebrities < authors <= options['feed_users']:
+            raise CommandError(
+                'Need celebrities < feed authors <= feed users'
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {User._meta.db_table} (password, '
+                'is_superuser, username, is_staff, is_active, date_joined, '
+                'email, first_name, last_name, avatar_variants, '
+                'recipes_count, followers_count) '
+                "SELECT '!', FALSE, 'feed' || n, FALSE, TRUE, NOW(), "
+                "'feed' || n || '@bench.local', 'Feed', 'Reader', '{}', "
+                '0, 0 '
+                'FROM generate_series(1, %s) n RETURNING id',
+                [options['feed_users']],
+            )
+            readers = sorted(pk for pk, in cursor.fetchall())
+            cursor.execute(
+                f'INSERT INTO {Recipe._meta.db_table} (author_id, name, '
+                'image, image_variants, text, cooking_time, pub_date, '
+                'short_link, favorites_count, shopping_cart_count, '
+                'card_version) '
+                "SELECT author_id, 'Feed recipe', 'recipes/images/feed.png', "
+                "'{}', '', 10, NOW() - random() * INTERVAL '30 days', "
+                'gen_random_uuid(), 0, 0, 0 '
+                'FROM unnest(%s::int[]) author_id, generate_series(1, %s)',
+                [readers[:authors], options['feed_recipes']],
+            )
+            pool = readers[celebrities:authors]
+            cursor.execute(
+                f'INSERT INTO {Subscription._meta.db_table} '
+                '(user_id, author_id) '
+                'SELECT reader, author FROM unnest(%s::int[]) reader, '
+                'unnest(%s::int[]) author WHERE reader <> author',
+                [readers, readers[:celebrities]],
+            )
+            cursor.execute(
+                f'INSERT INTO {Subscription._meta.db_table} '
+                '(user_id, author_id) '
+                'SELECT reader, author FROM ('
+                '    SELECT reader.id AS reader,'
+                '        (%s::int[])[1 + (reader.n * 7919 + step * 37) %% %s]'
+                '        AS author'
+                '    FROM unnest(%s::int[]) WITH ORDINALITY reader(id, n),'
+                '        generate_series(0, %s - 1) step'
+                ') link WHERE reader <> author '
+                'ON CONFLICT DO NOTHING',
+                [pool, len(pool), readers, options['follows'] - celebrities],
+            )
+            for model in (User, Recipe, Subscription):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return readers, pool
+
+    def bench_feed(self):
+        """Лента подписок против выборки по author_id__in при чтении."""
+        ordering = KeysetPagination.ordering
+        view = {'get': 'feed'}
+        with transaction.atomic():
+            started = time.perf_counter()
+            readers, pool = self.seed_feed()
+            self.report(
+                'seed', len(readers), (time.perf_counter() - started) * 1000
+            )
+            started = time.perf_counter()
+            rebuild()
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {TimelineEntry._meta.db_table}')
+            self.report(
+                f'rebuild, {MergedFeedAuthor.objects.count()} merged',
+                TimelineEntry.objects.count(),
+                (time.perf_counter() - started) * 1000,
+            )
+
+            rng = random.Random(0)
+            sample = User.objects.in_bulk(rng.sample(
+                readers, min(len(readers), self.options['repeat'] * 4)
+            ))
+            timings = defaultdict(list)
+            failures = []
+            for reader in sample.values():
+                self.user = reader
+                path = '/api/recipes/feed/'
+                last = None
+                for page in ('first', 'next'):
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.call_view(
+                            RecipeViewSet, view, 'get', path, None
+                        )
+                    timings[f'feed {page} page'].append(
+                        time.perf_counter() - started
+                    )
+                    timings[f'feed {page} queries'].append(len(queries))
+                    ids = [recipe['id'] for recipe in response.data['results']]
+                    pull = Recipe.objects.filter(
+                        author__subscriptions__user=reader
+                    ).order_by(*ordering).values_list('id', flat=True)
+                    if last is not None:
+                        pull = pull.filter(KeysetPagination()._seek_filter(
+                            ordering, Recipe.objects.filter(
+                                id=last
+                            ).values_list('pub_date', 'id').get()
+                        ))
+                    started = time.perf_counter()
+                    expected = list(pull[:len(ids) or 1])
+                    timings[f'pull {page} ids'].append(
+                        time.perf_counter() - started
+                    )
+                    if last is None:
+                        started = time.perf_counter()
+                        list(timeline(reader).order_by(
+                            *TIMELINE_ORDERING
+                        ).values_list('recipe_id', flat=True)[:len(ids) + 1])
+                        list(merged_recipes(reader).order_by(
+                            *ordering
+                        ).values_list('id', flat=True)[:len(ids) + 1])
+                        timings['timeline first ids'].append(
+                            time.perf_counter() - started
+                        )
+                    if ids != expected:
+                        failures.append(f'user={reader.id} {page} page')
+                    last = ids[-1] if ids else None
+                    path = response.data['next']
+                    if path is None or not ids:
+                        break
+            for label, values in timings.items():
+                if label.endswith('queries'):
+                    self.stdout.write(
+                        f'{label:<24} n={len(values):<6} {max(values):9d} max'
+                    )
+                else:
+                    self.report(
+                        label, len(values), statistics.median(values) * 1000
+                    )
+
+            author = User.objects.get(id=pool[0])
+            celebrity = User.objects.get(id=readers[0])
+            for label, publisher in (
+                ('publish', author), ('publish merged', celebrity),
+            ):
+                followers = Subscription.objects.filter(
+                    author=publisher
+                ).count()
+                started = time.perf_counter()
+                Recipe.objects.create(
+                    author=publisher, name='Feed recipe', text='',
+                    image='recipes/images/feed.png', cooking_time=10,
+                )
+                self.report(
+                    f'{label} to {followers}', followers,
+                    (time.perf_counter() - started) * 1000,
+                )
+
+            self.user = User.objects.get(id=readers[-1])
+            target = User.objects.filter(id__in=pool).exclude(
+                subscriptions__user=self.user
+            ).exclude(id=self.user.id).first()
+            actions = {'post': 'subscribe', 'delete': 'subscribe'}
+            for method in ('post', 'delete'):
+                started = time.perf_counter()
+                self.call_view(
+                    UserViewSet, actions, method,
+                    f'/api/users/{target.id}/subscribe/', None, pk=target.id,
+                )
+                self.report(
+                    f'{method} subscribe', 1,
+                    (time.perf_counter() - started) * 1000,
+                )
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Feed differs from the subscriptions query:\n'
+                + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Feed pages match'))
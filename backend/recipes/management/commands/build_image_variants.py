@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.variants import build
+from users.models import User
+
+MODELS = {'recipes': Recipe, 'avatars': User}
+
+
+class Command(BaseCommand):
+    help = (
+        'Render WebP and JPEG variants of recipe images and avatars that '
+        'have none or were replaced; run it periodically, e.g. every minute'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=sorted(MODELS),
+            help='Build variants for one kind of image',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Processes rendering images',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Images rendered before their variants are saved',
+        )
+
+    def handle(self, *args, **options):
+        kinds = [options['only']] if options['only'] else sorted(MODELS)
+        # fork: процессы пула получают настроенный Django без setup().
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(options['workers'], context) as pool:
+            for kind in kinds:
+                started = time.perf_counter()
+                done = build(
+                    MODELS[kind], pool, options['batch_size'],
+                    lambda done: self.stdout.write(
+                        f'{kind}: {done} images done'
+                    ),
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f'{kind}: variants saved for {done} images '
+                    f'in {time.perf_counter() - started:.1f} s'
+                ))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import build
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute top-K similar recipes from favorites co-occurrence for '
+        'recipes favorited since the last run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every recipe and drop recipes without favorites',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes = build(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Top {settings.SIMILAR_RECIPES_TOP_K} similar recipes '
+            f'recomputed for {recipes} recipes '
+            f'in {time.perf_counter() - started:.1f} s'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import consolidate
+
+
+class Command(BaseCommand):
+    help = (
+        'Move deferred counter changes into the counters; run it '
+        'periodically, e.g. every minute'
+    )
+
+    def handle(self, *args, **options):
+        for counter, objects in consolidate().items():
+            self.stdout.write(f'{counter}: {objects} objects updated')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.media import delete_queued
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete files queued for removal by recipe deletion; run it '
+        'periodically, e.g. every few minutes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1_000,
+            help='Files deleted per transaction',
+        )
+
+    def handle(self, *args, **options):
+        deleted = failed = 0
+        last_id = 0
+        # Файлы с ошибками остаются в очереди до следующего запуска.
+        while last_id is not None:
+            done, errors, last_id = delete_queued(
+                options['batch_size'], last_id
+            )
+            deleted += done
+            failed += errors
+        message = f'{deleted} files deleted'
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{message}, {failed} left in the queue after storage errors'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.deletion import resumable, run
+from recipes.models import RecipeDeletion
+
+
+class Command(BaseCommand):
+    help = (
+        'Run pending and interrupted recipe deletion jobs in id-ordered '
+        'batches; run it periodically, e.g. every minute'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job',
+            type=int,
+            action='append',
+            help='Run only this job, including a failed one; repeatable',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_DELETION_BATCH_SIZE,
+            help='Recipes deleted per transaction',
+        )
+
+    def progress(self, job):
+        self.stdout.write(
+            f'job {job.pk}: {job.deleted}/{job.total} deleted, '
+            f'last id {job.last_id}'
+        )
+
+    def handle(self, *args, **options):
+        if options['job']:
+            jobs = RecipeDeletion.objects.filter(
+                pk__in=options['job']
+            ).order_by('id')
+            missing = set(options['job']) - {job.pk for job in jobs}
+            if missing:
+                raise CommandError(f'Jobs not found: {sorted(missing)}')
+        else:
+            jobs = resumable()
+        for job in jobs:
+            if not run(job, options['batch_size'], self.progress):
+                self.stdout.write(f'job {job.pk}: running elsewhere, skipped')
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'job {job.pk}: done, {job.deleted} recipes deleted'
+            ))
@@ -2,6 +2,7 @@ import json
 
 from django.core.management.base import BaseCommand
 
+from recipes.cache import bump_versions
 from recipes.models import Ingredient
 
 
@@ -12,11 +13,20 @@ class Command(BaseCommand):
         with open('data/ingredients.json', 'r', encoding='utf-8') as file:
             ingredients = json.load(file)
 
-            for ingredient in ingredients:
-                Ingredient.objects.get_or_create(
-                    name=ingredient['name'],
-                    measurement_unit=ingredient['measurement_unit']
-                )
+            # Новые ингредиенты не входят ни в один рецепт, поэтому
+            # сигналы на каждую строку не нужны: достаточно сменить
+            # версию справочника.
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(
+                        name=ingredient['name'],
+                        measurement_unit=ingredient['measurement_unit']
+                    )
+                    for ingredient in ingredients
+                ],
+                ignore_conflicts=True,
+            )
+            bump_versions('ingredients')
 
         self.stdout.write(
             self.style.SUCCESS('Successfully loaded ingredients')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild
+from recipes.models import MergedFeedAuthor, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute merge-on-read authors from follower counts and rebuild '
+        'every subscription feed'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{TimelineEntry.objects.count()} feed entries, '
+            f'{MergedFeedAuthor.objects.count()} authors with more than '
+            f'{settings.FEED_FANOUT_MAX_FOLLOWERS} followers merged on read'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.shopping import find_drift, rebuild_users
+
+
+class Command(BaseCommand):
+    help = 'Diff shopping list totals against carts and rebuild drifted users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift and exit with an error if any is found',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='How many drifted rows to print',
+        )
+
+    def handle(self, *args, **options):
+        drift = find_drift()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Shopping lists are in sync'))
+            return
+        for user_id, ingredient_id, expected, actual in drift[
+            :options['show']
+        ]:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id} '
+                f'expected={expected} actual={actual}'
+            )
+        users = sorted({user_id for user_id, *_ in drift})
+        message = f'{len(drift)} rows drifted for {len(users)} users'
+        if options['check']:
+            raise CommandError(message)
+        with transaction.atomic():
+            rebuild_users(users)
+        self.stdout.write(self.style.SUCCESS(f'{message}, rebuilt'))
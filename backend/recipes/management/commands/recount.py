@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, find_drift, recount
+
+
+class Command(BaseCommand):
+    help = 'Diff stored counters against COUNT(*) and recount drifted rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--counter',
+            action='append',
+            choices=sorted(COUNTERS),
+            help='Counter to verify, all by default; can be repeated',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift and exit with an error if any is found',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='How many drifted rows to print per counter',
+        )
+
+    def handle(self, *args, **options):
+        messages = []
+        for counter in options['counter'] or COUNTERS:
+            drift = find_drift(counter)
+            if not drift:
+                self.stdout.write(f'{counter}: in sync')
+                continue
+            for object_id, expected, actual in drift[:options['show']]:
+                self.stdout.write(
+                    f'{counter} id={object_id} '
+                    f'expected={expected} actual={actual}'
+                )
+            message = f'{counter}: {len(drift)} rows drifted'
+            messages.append(message)
+            if not options['check']:
+                recount(counter, [object_id for object_id, *_ in drift])
+                self.stdout.write(self.style.SUCCESS(f'{message}, recounted'))
+        if messages and options['check']:
+            raise CommandError('\n'.join(messages))
+        if not messages:
+            self.stdout.write(self.style.SUCCESS('Counters are in sync'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.cache import bump_versions
+
+RESOURCES = ('tags', 'ingredients')
+
+
+class Command(BaseCommand):
+    help = 'Force every worker to rebuild its tag and ingredient snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'resources',
+            nargs='*',
+            help=f'Resources to refresh: {", ".join(RESOURCES)} (default)',
+        )
+
+    def handle(self, *args, **options):
+        resources = options['resources'] or RESOURCES
+        unknown = set(resources) - set(RESOURCES)
+        if unknown:
+            raise CommandError(f'Unknown resources: {", ".join(unknown)}')
+        bump_versions(*resources)
+        self.stdout.write(self.style.SUCCESS(
+            f'Bumped versions: {", ".join(resources)}'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import rebuild, renormalize
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the trending decay base to the current half-life period; '
+        'run it periodically, e.g. weekly'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help=(
+                'Recompute every score from favorites and shopping carts, '
+                'e.g. after changing TRENDING_HALF_LIFE'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild()
+            self.stdout.write(self.style.SUCCESS('Trending scores rebuilt'))
+            return
+        steps = renormalize()
+        self.stdout.write(self.style.SUCCESS(
+            f'Decay base moved by {steps} half-life periods'
+        ))
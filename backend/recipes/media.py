@@ -0,0 +1,52 @@
+"""Отложенное удаление файлов изображений.
+
+Удаление рецепта записывает путь его изображения в MediaDeletion в той
+же транзакции; сами файлы удаляет команда delete_media вне запросов.
+Если транзакция откатится, файл останется на месте.
+"""
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from recipes.models import MediaDeletion, Recipe
+
+
+def queue_files(names):
+    """Ставит в очередь удаления непустые пути хранилища."""
+    MediaDeletion.objects.bulk_create(
+        MediaDeletion(name=name) for name in names if name
+    )
+
+
+@transaction.atomic
+def delete_queued(limit, after_id=0):
+    """Удаляет до limit файлов из очереди с id больше after_id.
+
+    Возвращает (удалено, оставлено из-за ошибок хранилища, последний
+    просмотренный id или None, если строк нет). Путь, на который снова
+    ссылается рецепт, снимается с очереди без удаления файла. Строки
+    блокируются с SKIP LOCKED, поэтому команды могут работать
+    параллельно.
+    """
+    rows = list(
+        MediaDeletion.objects.select_for_update(skip_locked=True)
+        .filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'name')[:limit]
+    )
+    if not rows:
+        return 0, 0, None
+    used = set(Recipe.objects.filter(
+        image__in={name for _, name in rows}
+    ).values_list('image', flat=True))
+    done = []
+    failed = 0
+    for pk, name in rows:
+        if name not in used:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                failed += 1
+                continue
+        done.append(pk)
+    MediaDeletion.objects.filter(pk__in=done).delete()
+    return len(done), failed, rows[-1][0]
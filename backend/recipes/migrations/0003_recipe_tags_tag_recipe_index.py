@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_search'),
+    ]
+
+    # Автоматическая промежуточная таблица не поддерживает Meta.indexes.
+    # Уникальный индекс (recipe_id, tag_id) уже есть; обратный порядок
+    # нужен для выборки рецептов по тегам index-only scan.
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX IF NOT EXISTS recipe_tags_tag_recipe_idx '
+                'ON recipes_recipe_tags (tag_id, recipe_id)'
+            ),
+            reverse_sql='DROP INDEX IF EXISTS recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.10 on 2026-10-17 05:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0004_hot_query_indexes'),
+        ('recipes', '0005_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MergedFeedAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='merged_feed', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Автор без раскладки по лентам',
+                'verbose_name_plural': 'Авторы без раскладки по лентам',
+            },
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'indexes': [models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_feed_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunSQL(
+            # Лента из 100 новых рецептов каждого автора подписки;
+            # пороги merge on read применяет команда rebuild_feeds.
+            sql="""
+                INSERT INTO recipes_timelineentry
+                    (user_id, recipe_id, author_id, pub_date)
+                SELECT subscription.user_id, recipe.id, recipe.author_id,
+                    recipe.pub_date
+                FROM (
+                    SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                        PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+                    ) AS position
+                    FROM recipes_recipe
+                ) recipe
+                JOIN users_subscription subscription
+                    ON subscription.author_id = recipe.author_id
+                WHERE recipe.position <= 100
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
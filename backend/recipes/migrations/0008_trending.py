@@ -0,0 +1,79 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingBase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shift', models.IntegerField(verbose_name='Сдвиг базы')),
+            ],
+            options={
+                'verbose_name': 'База затухания популярности',
+                'verbose_name_plural': 'База затухания популярности',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(default=0, verbose_name='Популярность')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+                'indexes': [models.Index(fields=['-score', '-recipe'], name='trending_score_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            # Строкам избранного и корзины достаётся время миграции.
+            # База и значения считаются для периода полураспада по
+            # умолчанию (302400 с); при другом TRENDING_HALF_LIFE нужен
+            # renormalize_trending --rebuild.
+            sql="""
+                INSERT INTO recipes_trendingbase (id, shift)
+                SELECT 1, FLOOR(
+                    (EXTRACT(EPOCH FROM NOW()) - 1704067200) / 302400
+                );
+                INSERT INTO recipes_trendingscore (recipe_id, score)
+                SELECT recipe.id, COALESCE(SUM(event.weight * POWER(
+                    2::float8,
+                    (EXTRACT(EPOCH FROM event.created) - 1704067200)
+                        / 302400 - base.shift
+                )), 0)
+                FROM recipes_recipe recipe
+                CROSS JOIN recipes_trendingbase base
+                LEFT JOIN (
+                    SELECT recipe_id, created, 1.0 AS weight
+                    FROM recipes_favorite
+                    UNION ALL
+                    SELECT recipe_id, created, 0.5 AS weight
+                    FROM recipes_shoppingcart
+                ) event ON event.recipe_id = recipe.id
+                GROUP BY recipe.id, base.shift;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.CreateModel(
+            name='CounterDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counter', models.CharField(max_length=32, verbose_name='Счётчик')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('delta', models.IntegerField(verbose_name='Изменение')),
+            ],
+            options={
+                'verbose_name': 'Отложенное изменение счётчика',
+                'verbose_name_plural': 'Отложенные изменения счётчиков',
+                'indexes': [models.Index(fields=['counter', 'object_id'], name='counter_delta_object_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE recipes_recipe recipe
+                SET favorites_count = source.total
+                FROM (
+                    SELECT recipe_id, COUNT(*) AS total
+                    FROM recipes_favorite GROUP BY recipe_id
+                ) source
+                WHERE source.recipe_id = recipe.id;
+                UPDATE recipes_recipe recipe
+                SET shopping_cart_count = source.total
+                FROM (
+                    SELECT recipe_id, COUNT(*) AS total
+                    FROM recipes_shoppingcart GROUP BY recipe_id
+                ) source
+                WHERE source.recipe_id = recipe.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
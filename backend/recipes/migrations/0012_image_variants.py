@@ -0,0 +1,24 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:54
+
+from django.db import migrations, models
+import django.db.models.fields.json
+import django.db.models.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('image__isnull', False), models.Q(('image', ''), _negated=True), models.Q(django.db.models.lookups.IsNull(django.db.models.fields.json.KeyTextTransform('source', 'image_variants'), True), models.Q(django.db.models.lookups.Exact(django.db.models.fields.json.KeyTextTransform('source', 'image_variants'), models.F('image')), _negated=True), _connector='OR')), fields=['id'], name='recipe_image_variants_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_resource_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_feed_idx',
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия карточки'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], include=('author', 'card_version'), name='recipe_feed_idx'),
+        ),
+    ]
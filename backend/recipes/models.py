@@ -1,8 +1,15 @@
 import uuid
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Upper
+
+from recipes.images import outdated
+from recipes.managed import ManagedFieldsMixin
 
 User = get_user_model()
 
@@ -14,6 +21,17 @@ MAX_COOKING_TIME = 32_000
 MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 32_000
 
+# Конфигурация полнотекстового поиска по рецептам
+SEARCH_CONFIG = 'russian'
+
+
+def recipe_search_vector():
+    # То же выражение использует миграция 0002 для заполнения поля.
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -45,7 +63,6 @@ class Ingredient(models.Model):
     name = models.CharField(
         max_length=200,
         verbose_name='Название',
-        db_index=True,
     )
     measurement_unit = models.CharField(
         max_length=200,
@@ -62,17 +79,25 @@ class Ingredient(models.Model):
                 name='unique_ingredient_measurement',
             )
         ]
+        indexes = [
+            # name__istartswith: UPPER(name) LIKE 'ПРЕФИКС%'.
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='ingredient_upper_name_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class Recipe(ManagedFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
         verbose_name='Автор',
+        db_index=False,
     )
     name = models.CharField(
         max_length=200,
@@ -83,6 +108,12 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Изображение',
     )
+    # Заполняется командой build_image_variants, см. recipes.images.
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Варианты изображения',
+    )
     text = models.TextField(
         verbose_name='Описание',
     )
@@ -115,7 +146,6 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации',
-        db_index=True,
     )
     in_favorites = models.ManyToManyField(
         User,
@@ -135,11 +165,76 @@ class Recipe(models.Model):
         unique=True,
         verbose_name='Короткая ссылка',
     )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+    # Обновляются recipes.counters; для популярных рецептов часть
+    # изменений ждёт consolidate_counters в CounterDelta.
+    favorites_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    shopping_cart_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+
+    # Увеличивается сигналами и командами при изменении всего, что
+    # попадает в карточку рецепта; входит в ключ карточки в кэше.
+    card_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия карточки',
+    )
+
+    managed_fields = (
+        'image_variants', 'favorites_count', 'shopping_cart_count',
+        'card_version',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            # Лента: ORDER BY pub_date DESC, id DESC. author_id и версия
+            # карточки в INCLUDE, чтобы страница карточек читалась
+            # index-only scan.
+            models.Index(
+                fields=['-pub_date', '-id'],
+                include=['author', 'card_version'],
+                name='recipe_feed_idx',
+            ),
+            # Лента автора; заменяет индекс внешнего ключа author.
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_feed_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+            GinIndex(
+                fields=['name'],
+                name='recipe_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+            # Поиск админки: icontains строит UPPER(name) LIKE '%...%'.
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='recipe_name_upper_trgm_idx',
+            ),
+            # Очередь build_image_variants; пуста, когда варианты собраны.
+            models.Index(
+                fields=['id'],
+                condition=outdated('image', 'image_variants'),
+                name='recipe_image_variants_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -198,11 +293,17 @@ class Favorite(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
+        db_index=False,
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
     )
 
     class Meta:
@@ -214,6 +315,13 @@ class Favorite(models.Model):
                 name='unique_favorite',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe'],
+                include=['user'],
+                name='favorite_recipe_user_idx',
+            ),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -221,11 +329,17 @@ class ShoppingCart(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
+        db_index=False,
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
     )
 
     class Meta:
@@ -237,3 +351,382 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe'],
+                include=['user'],
+                name='shoppingcart_recipe_user_idx',
+            ),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по корзине пользователя.
+
+    Поддерживается функциями recipes.shopping при изменении корзины
+    и состава рецептов; сверяется командой reconcile_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика, разложенный при публикации.
+
+    pub_date и author копируются из рецепта, чтобы страница ленты
+    читалась по индексу одной таблицы.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        db_index=False,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_feed_idx',
+            ),
+            # Отписка удаляет записи автора из ленты подписчика.
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx',
+            ),
+        ]
+
+
+class MergedFeedAuthor(models.Model):
+    """Автор, чьи рецепты подмешиваются в ленты при чтении."""
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='merged_feed',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Автор без раскладки по лентам'
+        verbose_name_plural = 'Авторы без раскладки по лентам'
+
+
+class RecipeSimilarity(models.Model):
+    """Рецепт, который часто добавляют в избранное вместе с данным.
+
+    Строится командой build_similar_recipes.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт',
+        db_index=False,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Косинусная близость',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity',
+            )
+        ]
+
+
+class SimilarityBuild(models.Model):
+    """Запуск build_similar_recipes.
+
+    Следующий запуск без --full пересчитывает рецепты из Favorite
+    с id больше last_favorite_id.
+    """
+
+    last_favorite_id = models.BigIntegerField(
+        verbose_name='Последний учтённый id избранного',
+    )
+    recipes = models.PositiveIntegerField(
+        verbose_name='Пересчитано рецептов',
+    )
+    full = models.BooleanField(
+        verbose_name='Полный пересчёт',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата запуска',
+    )
+
+    class Meta:
+        verbose_name = 'Расчёт похожих рецептов'
+        verbose_name_plural = 'Расчёты похожих рецептов'
+
+
+class TrendingScore(models.Model):
+    """Популярность рецепта с экспоненциальным затуханием.
+
+    Событие в момент t добавляет вес * 2 ** ((t - TRENDING_ORIGIN) /
+    TRENDING_HALF_LIFE - shift), где shift берётся из TrendingBase.
+    Со временем значения не меняются, поэтому порядок рецептов
+    меняют только сами события.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Рецепт',
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Популярность',
+    )
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'],
+                name='trending_score_idx',
+            ),
+        ]
+
+
+class TrendingBase(models.Model):
+    """База затухания: число периодов полураспада от TRENDING_ORIGIN.
+
+    Единственная строка; переносится командой renormalize_trending.
+    """
+
+    shift = models.IntegerField(
+        verbose_name='Сдвиг базы',
+    )
+
+    class Meta:
+        verbose_name = 'База затухания популярности'
+        verbose_name_plural = 'База затухания популярности'
+
+
+class CounterDelta(models.Model):
+    """Изменение счётчика, отложенное из-за блокировки его строки.
+
+    consolidate_counters переносит накопленные изменения в счётчики.
+    """
+
+    counter = models.CharField(
+        max_length=32,
+        verbose_name='Счётчик',
+    )
+    object_id = models.BigIntegerField(
+        verbose_name='id объекта',
+    )
+    delta = models.IntegerField(
+        verbose_name='Изменение',
+    )
+
+    class Meta:
+        verbose_name = 'Отложенное изменение счётчика'
+        verbose_name_plural = 'Отложенные изменения счётчиков'
+        indexes = [
+            models.Index(
+                fields=['counter', 'object_id'],
+                name='counter_delta_object_idx',
+            ),
+        ]
+
+
+class RecipeDeletion(models.Model):
+    """Пакетное удаление рецептов автора или списка id.
+
+    Выполняется командой delete_recipes пакетами по возрастанию id.
+    last_id и deleted обновляются в транзакции пакета, поэтому
+    прерванное удаление продолжается со следующего за last_id рецепта.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершено'
+        FAILED = 'failed', 'Ошибка'
+
+    # Без внешнего ключа в БД: удаление автора не должно стирать
+    # условие задачи.
+    author = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    recipe_ids = ArrayField(
+        models.BigIntegerField(),
+        null=True,
+        blank=True,
+        verbose_name='id рецептов',
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Создал',
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Состояние',
+    )
+    total = models.PositiveIntegerField(
+        verbose_name='Рецептов при создании',
+    )
+    deleted = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Удалено',
+    )
+    last_id = models.BigIntegerField(
+        default=0,
+        verbose_name='Последний удалённый id',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания',
+    )
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата завершения',
+    )
+
+    class Meta:
+        verbose_name = 'Пакетное удаление рецептов'
+        verbose_name_plural = 'Пакетные удаления рецептов'
+        ordering = ['-id']
+        constraints = [
+            # Задача без условия удалила бы все рецепты.
+            models.CheckConstraint(
+                check=(
+                    models.Q(author__isnull=False, recipe_ids__isnull=True)
+                    | models.Q(author__isnull=True, recipe_ids__isnull=False)
+                ),
+                name='recipe_deletion_one_condition',
+            ),
+        ]
+
+    def __str__(self):
+        return f'#{self.pk}: {self.deleted} из {self.total}'
+
+
+class MediaDeletion(models.Model):
+    """Файл хранилища, который удалит команда delete_media."""
+
+    name = models.CharField(
+        max_length=255,
+        verbose_name='Путь в хранилище',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
+
+    class Meta:
+        verbose_name = 'Файл к удалению'
+        verbose_name_plural = 'Файлы к удалению'
+
+
+class ResourceVersion(models.Model):
+    """Версия ресурса API для ETag и снимков в памяти воркеров.
+
+    Хранится в БД, а не в кэше, чтобы смену версии из команды или
+    другого воркера видели все процессы. См. recipes.cache.
+    """
+
+    name = models.CharField(
+        max_length=32,
+        primary_key=True,
+        verbose_name='Ресурс',
+    )
+    version = models.CharField(
+        max_length=32,
+        verbose_name='Версия',
+    )
+    modified = models.DateTimeField(
+        verbose_name='Дата изменения',
+    )
+
+    class Meta:
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'Версии ресурсов'
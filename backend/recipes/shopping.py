@@ -0,0 +1,112 @@
+"""Инкрементальное обновление ShoppingListItem.
+
+Изменения корзины передаются списком id рецептов, которые были
+действительно добавлены или удалены, и разница считается по их составу.
+Изменения состава рецепта считаются по строкам корзины: добавление
+вызывается после записи RecipeIngredient, вычитание — до удаления,
+в той же транзакции.
+"""
+from django.db import connection
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+ITEMS = ShoppingListItem._meta.db_table
+CART = ShoppingCart._meta.db_table
+RECIPE_INGREDIENTS = RecipeIngredient._meta.db_table
+
+CART_DELTA_SQL = f"""
+    SELECT %s AS user_id, item.ingredient_id, SUM(item.amount) AS amount
+    FROM {RECIPE_INGREDIENTS} item
+    WHERE item.recipe_id = ANY(%s)
+    GROUP BY item.ingredient_id
+"""
+
+DELTA_SQL = f"""
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount) AS amount
+    FROM {CART} cart
+    JOIN {RECIPE_INGREDIENTS} item ON item.recipe_id = cart.recipe_id
+    WHERE {{condition}}
+    GROUP BY cart.user_id, item.ingredient_id
+"""
+
+ADD_SQL = f"""
+    INSERT INTO {ITEMS} (user_id, ingredient_id, total_amount)
+    {{delta}}
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET total_amount = {ITEMS}.total_amount + EXCLUDED.total_amount
+"""
+
+SUBTRACT_SQL = f"""
+    UPDATE {ITEMS} AS total
+    SET total_amount = GREATEST(total.total_amount - delta.amount, 0)
+    FROM ({{delta}}) AS delta
+    WHERE total.user_id = delta.user_id
+        AND total.ingredient_id = delta.ingredient_id
+    RETURNING total.id, total.total_amount
+"""
+
+DRIFT_SQL = f"""
+    SELECT
+        COALESCE(expected.user_id, total.user_id),
+        COALESCE(expected.ingredient_id, total.ingredient_id),
+        expected.amount,
+        total.total_amount
+    FROM ({DELTA_SQL.format(condition='TRUE')}) AS expected
+    FULL OUTER JOIN {ITEMS} total
+        ON total.user_id = expected.user_id
+        AND total.ingredient_id = expected.ingredient_id
+    WHERE expected.amount IS DISTINCT FROM total.total_amount
+    ORDER BY 1, 2
+"""
+
+RECIPE_CONDITION = 'cart.recipe_id = %s'
+RECIPES_CONDITION = 'cart.recipe_id = ANY(%s)'
+USERS_CONDITION = 'cart.user_id = ANY(%s)'
+
+
+def _add(delta, params):
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_SQL.format(delta=delta), params)
+
+
+def _subtract(delta, params):
+    with connection.cursor() as cursor:
+        cursor.execute(SUBTRACT_SQL.format(delta=delta), params)
+        empty = [pk for pk, total in cursor.fetchall() if total == 0]
+    if empty:
+        ShoppingListItem.objects.filter(pk__in=empty).delete()
+
+
+def add_cart_recipes(user_id, recipe_ids):
+    _add(CART_DELTA_SQL, [user_id, list(recipe_ids)])
+
+
+def remove_cart_recipes(user_id, recipe_ids):
+    _subtract(CART_DELTA_SQL, [user_id, list(recipe_ids)])
+
+
+def add_recipe_ingredients(recipe_id):
+    _add(DELTA_SQL.format(condition=RECIPE_CONDITION), [recipe_id])
+
+
+def remove_recipe_ingredients(recipe_id):
+    _subtract(DELTA_SQL.format(condition=RECIPE_CONDITION), [recipe_id])
+
+
+def remove_recipes_ingredients(recipe_ids):
+    _subtract(
+        DELTA_SQL.format(condition=RECIPES_CONDITION), [list(recipe_ids)]
+    )
+
+
+def find_drift():
+    """Строки (user_id, ingredient_id, ожидается, в таблице)."""
+    with connection.cursor() as cursor:
+        cursor.execute(DRIFT_SQL)
+        return cursor.fetchall()
+
+
+def rebuild_users(user_ids):
+    user_ids = list(user_ids)
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    _add(DELTA_SQL.format(condition=USERS_CONDITION), [user_ids])
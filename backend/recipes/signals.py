@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from recipes.cache import bump_cards, bump_versions
+from recipes.counters import change_counter, remove_user_links
+from recipes.feed import fan_out_recipe
+from recipes.images import variant_names
+from recipes.media import queue_files
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+    recipe_search_vector,
+)
+from recipes.shopping import remove_recipe_ingredients
+from recipes.trending import create_score
+
+# Поля пользователя, которые попадают в карточку рецепта.
+CARD_USER_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+# Поля рецепта, из которых строится поисковый вектор.
+SEARCH_FIELDS = frozenset(('name', 'text'))
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields and not SEARCH_FIELDS & update_fields:
+        return
+    Recipe.objects.filter(pk=instance.pk).update(
+        search_vector=recipe_search_vector()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def create_trending_score(sender, instance, created, **kwargs):
+    if created:
+        create_score(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def count_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        change_counter('recipes_count', [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    change_counter('recipes_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_card(sender, instance, created, **kwargs):
+    if not created:
+        bump_cards(Recipe.objects.filter(pk=instance.pk))
+    bump_versions('recipes')
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    bump_versions('recipes')
+
+
+@receiver(post_delete, sender=Recipe)
+def queue_recipe_image(sender, instance, **kwargs):
+    queue_files([
+        instance.image.name, *variant_names(instance.image_variants)
+    ])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    # Строки корзины удаляются каскадом и ещё видны в pre_delete.
+    remove_recipe_ingredients(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_ingredient_card(sender, instance, **kwargs):
+    bump_cards(Recipe.objects.filter(pk=instance.recipe_id))
+    bump_versions('recipes')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_card(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_cards(Recipe.objects.filter(pk=instance.pk))
+    elif pk_set:
+        bump_cards(Recipe.objects.filter(pk__in=pk_set))
+    else:
+        bump_cards(Recipe.objects.filter(tags=instance))
+    bump_versions('recipes')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_cards(sender, instance, **kwargs):
+    bump_cards(Recipe.objects.filter(tags=instance))
+    bump_versions('tags', 'recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def invalidate_ingredient_cards(sender, instance, **kwargs):
+    bump_cards(Recipe.objects.filter(ingredients=instance))
+    bump_versions('ingredients', 'recipes')
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remove_user_counters(sender, instance, **kwargs):
+    # Избранное, корзина и подписки удаляются каскадом без сигналов.
+    remove_user_links(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_cards(sender, instance, created, update_fields,
+                            **kwargs):
+    if created or (
+        update_fields is not None and not CARD_USER_FIELDS & update_fields
+    ):
+        return
+    bump_cards(Recipe.objects.filter(author=instance))
+    bump_versions('recipes')
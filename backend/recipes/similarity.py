@@ -0,0 +1,185 @@
+"""Похожие рецепты по совместному добавлению в избранное.
+
+Рецепт описывается строкой матрицы рецепт × пользователь из Favorite,
+похожесть — косинус между строками. Соседи считаются блоками строк:
+размер блока подбирается так, чтобы произведение блока на матрицу
+содержало не больше SIMILAR_RECIPES_BLOCK_ENTRIES ненулевых значений.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from scipy import sparse
+
+from recipes.cache import bump_versions
+from recipes.models import Favorite, RecipeSimilarity, SimilarityBuild
+
+FAVORITES = Favorite._meta.db_table
+SIMILARITY = RecipeSimilarity._meta.db_table
+
+FETCH_SIZE = 100_000
+# Рецептов в одной транзакции записи: списки уходят в запрос
+# литералами ARRAY[...], и их разбор стоит памяти сервера.
+WRITE_SIZE = 5_000
+SCORE_DIGITS = 6
+
+FETCH_SQL = f"""
+    SELECT id, user_id, recipe_id FROM {FAVORITES}
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+DELETE_SQL = f'DELETE FROM {SIMILARITY} WHERE recipe_id = ANY(%s)'
+
+DELETE_STALE_SQL = f"""
+    DELETE FROM {SIMILARITY} similarity
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {FAVORITES} favorite
+        WHERE favorite.recipe_id = similarity.recipe_id
+    )
+"""
+
+INSERT_SQL = f"""
+    INSERT INTO {SIMILARITY} (recipe_id, similar_id, score)
+    SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::float8[])
+"""
+
+
+def load_favorites(watermark=0):
+    """user_id и recipe_id всех строк Favorite.
+
+    Строки читаются порциями по id. Кроме массивов возвращаются
+    рецепты, добавленные в избранное после watermark, и
+    максимальный прочитанный id.
+    """
+    users, recipes, changed = [], [], []
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(FETCH_SQL, [last_id, FETCH_SIZE])
+            rows = np.array(cursor.fetchall(), dtype=np.int64)
+            if not len(rows):
+                break
+            last_id = int(rows[-1, 0])
+            users.append(rows[:, 1])
+            recipes.append(rows[:, 2])
+            changed.append(rows[rows[:, 0] > watermark, 2])
+    if not users:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, 0
+    return (
+        np.concatenate(users),
+        np.concatenate(recipes),
+        np.unique(np.concatenate(changed)),
+        last_id,
+    )
+
+
+def favorites_matrix(users, recipes):
+    """id рецептов и CSR-матрица с нормированными строками."""
+    recipe_ids, rows = np.unique(recipes, return_inverse=True)
+    user_ids, columns = np.unique(users, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), len(user_ids)),
+    )
+    # Значения двоичные, поэтому норма строки — корень из её длины.
+    norms = np.sqrt(np.diff(matrix.indptr)).astype(np.float32)
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+    return recipe_ids, matrix
+
+
+def blocks(matrix, rows, budget):
+    """Делит rows на блоки не больше budget ненулевых в произведении.
+
+    Оценка для строки — сумма числа избранного её пользователей,
+    но не больше числа рецептов.
+    """
+    binary = matrix[rows].astype(bool).astype(np.float32)
+    degrees = np.diff(matrix.tocsc().indptr).astype(np.float32)
+    costs = np.minimum(binary @ degrees, matrix.shape[0])
+    cumulative = np.cumsum(costs)
+    start = 0
+    while start < len(rows):
+        offset = cumulative[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(
+            cumulative, offset + budget, side='right'
+        )))
+        yield rows[start:end]
+        start = end
+
+
+def top_neighbours(matrix, transposed, rows, top_k):
+    """(позиция в rows, сосед, косинус) для top_k соседей строк rows.
+
+    Результат упорядочен по позиции.
+
+    Косинус округляется до SCORE_DIGITS знаков, чтобы соседи с равной
+    близостью упорядочивались по номеру строки, а не по погрешности
+    float32.
+    """
+    product = (matrix[rows] @ transposed).tocsr()
+    owners = np.repeat(np.arange(len(rows)), np.diff(product.indptr))
+    keep = product.indices != rows[owners]
+    owners = owners[keep]
+    columns = product.indices[keep]
+    scores = product.data[keep].round(SCORE_DIGITS)
+    order = np.lexsort((columns, -scores, owners))
+    owners, columns, scores = owners[order], columns[order], scores[order]
+    starts = np.searchsorted(owners, np.arange(len(rows)))
+    ranks = np.arange(len(owners)) - starts[owners]
+    keep = ranks < top_k
+    return owners[keep], columns[keep], scores[keep]
+
+
+def write_neighbours(recipe_ids, sources, similar, scores):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(DELETE_SQL, [recipe_ids.tolist()])
+        cursor.execute(
+            INSERT_SQL,
+            [sources.tolist(), similar.tolist(), scores.tolist()],
+        )
+
+
+def build(full=False):
+    """Пересчитывает соседей и возвращает число пересчитанных рецептов.
+
+    Без full пересчитываются только рецепты, добавленные в избранное
+    после прошлого запуска. Удаление из избранного id не меняет,
+    поэтому оно учитывается полным пересчётом.
+    """
+    last_build = SimilarityBuild.objects.order_by('-id').first()
+    previous_id = 0 if last_build is None else last_build.last_favorite_id
+    watermark = 0 if full else previous_id
+    users, recipes, changed, last_id = load_favorites(watermark)
+    recipe_ids, matrix = favorites_matrix(users, recipes)
+    del users, recipes
+    rows = np.searchsorted(recipe_ids, changed)
+    transposed = matrix.T.tocsr()
+    for block in blocks(
+        matrix, rows, settings.SIMILAR_RECIPES_BLOCK_ENTRIES
+    ):
+        positions, similar, scores = top_neighbours(
+            matrix, transposed, block, settings.SIMILAR_RECIPES_TOP_K
+        )
+        for start in range(0, len(block), WRITE_SIZE):
+            first, last = np.searchsorted(
+                positions, [start, start + WRITE_SIZE]
+            )
+            write_neighbours(
+                recipe_ids[block[start:start + WRITE_SIZE]],
+                recipe_ids[block[positions[first:last]]],
+                recipe_ids[similar[first:last]],
+                scores[first:last],
+            )
+    if full or last_build is None:
+        # Рецепты, у которых не осталось избранного.
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_STALE_SQL)
+    SimilarityBuild.objects.create(
+        last_favorite_id=max(last_id, previous_id),
+        recipes=len(rows),
+        full=full or last_build is None,
+    )
+    bump_versions('similar')
+    return len(rows)
@@ -0,0 +1,63 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from recipes.similarity import (
+    SCORE_DIGITS,
+    blocks,
+    favorites_matrix,
+    top_neighbours,
+)
+
+TOP_K = 10
+
+
+class TopNeighboursTests(SimpleTestCase):
+    """Соседи из разреженного произведения совпадают с плотным.
+
+    Синтетическое избранное: популярность рецептов убывает степенно,
+    поэтому у части рецептов много соседей с равной близостью.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        recipe_count = 300
+        users = rng.integers(0, 200, 6000)
+        recipes = (recipe_count * rng.random(6000) ** 3).astype(np.int64)
+        pairs = np.unique(users * recipe_count + recipes)
+        _, self.matrix = favorites_matrix(
+            pairs // recipe_count, pairs % recipe_count
+        )
+        self.transposed = self.matrix.T.tocsr()
+        self.rows = np.arange(self.matrix.shape[0])
+
+    def dense_neighbours(self, row):
+        scores = (self.matrix[row] @ self.transposed).toarray().ravel()
+        scores = scores.round(SCORE_DIGITS)
+        scores[row] = 0
+        candidates = np.flatnonzero(scores)
+        return list(candidates[
+            np.lexsort((candidates, -scores[candidates]))
+        ][:TOP_K])
+
+    def test_rows_match_dense_product(self):
+        owners, similar, _ = top_neighbours(
+            self.matrix, self.transposed, self.rows, TOP_K
+        )
+        for row in self.rows:
+            with self.subTest(row=row):
+                self.assertEqual(
+                    list(similar[owners == row]), self.dense_neighbours(row)
+                )
+
+    def test_blocks_give_same_neighbours(self):
+        parts = list(blocks(self.matrix, self.rows, 5000))
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(list(np.concatenate(parts)), list(self.rows))
+        _, expected, _ = top_neighbours(
+            self.matrix, self.transposed, self.rows, TOP_K
+        )
+        similar = np.concatenate([
+            top_neighbours(self.matrix, self.transposed, block, TOP_K)[1]
+            for block in parts
+        ])
+        self.assertEqual(list(similar), list(expected))
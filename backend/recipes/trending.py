@@ -0,0 +1,191 @@
+"""Популярность рецептов с экспоненциальным затуханием (forward decay).
+
+Избранное и корзина добавляют к TrendingScore вклад, растущий
+со временем события; вычитается тот же вклад по дате добавления
+строки. Чтобы вклады не переполняли float, renormalize переносит базу
+на целое число периодов полураспада: все значения делятся на степень
+двойки, то есть точно, и порядок рецептов не меняется.
+
+Запись вклада и перенос базы сериализуются advisory-блокировкой:
+вклад, посчитанный от старой базы, не попадёт в уже пересчитанные
+значения.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from recipes.cache import bump_versions
+from recipes.models import (
+    Favorite,
+    Recipe,
+    ShoppingCart,
+    TrendingBase,
+    TrendingScore,
+)
+
+SCORES = TrendingScore._meta.db_table
+BASE = TrendingBase._meta.db_table
+FAVORITES = Favorite._meta.db_table
+CART = ShoppingCart._meta.db_table
+RECIPES = Recipe._meta.db_table
+
+# 2024-01-01 00:00 UTC.
+TRENDING_ORIGIN = 1_704_067_200
+TRENDING_LOCK = 0x7472656e64
+WEIGHTS = {Favorite: 1.0, ShoppingCart: 0.5}
+
+CONTRIBUTION = f"""
+    POWER(2::float8, (EXTRACT(EPOCH FROM event.created) - %(origin)s)
+        / %(half_life)s - (SELECT shift FROM {BASE}))
+"""
+
+RECENT_EVENTS_SQL = """
+    SELECT recipe_id, NOW() AS created, %(weight)s AS weight
+    FROM unnest(%(recipes)s::bigint[]) AS recipe_id
+"""
+
+EVENTS_SQL = """
+    SELECT recipe_id, created, %(weight)s AS weight
+    FROM unnest(%(recipes)s::bigint[], %(created)s::timestamptz[])
+        AS event(recipe_id, created)
+"""
+
+ALL_EVENTS_SQL = f"""
+    SELECT recipe_id, created, %(favorite)s AS weight FROM {FAVORITES}
+    UNION ALL
+    SELECT recipe_id, created, %(cart)s AS weight FROM {CART}
+"""
+
+DELTA_SQL = f"""
+    SELECT event.recipe_id, SUM(event.weight * {CONTRIBUTION}) AS score
+    FROM ({{events}}) AS event
+    GROUP BY event.recipe_id
+"""
+
+ADD_SQL = f"""
+    INSERT INTO {SCORES} (recipe_id, score)
+    {DELTA_SQL}
+    ON CONFLICT (recipe_id) DO UPDATE
+    SET score = {SCORES}.score + EXCLUDED.score
+"""
+
+SUBTRACT_SQL = f"""
+    UPDATE {SCORES} AS trending
+    SET score = GREATEST(trending.score - delta.score, 0)
+    FROM ({DELTA_SQL}) AS delta
+    WHERE trending.recipe_id = delta.recipe_id
+"""
+
+SET_BASE_SQL = f"""
+    INSERT INTO {BASE} (id, shift) VALUES (1, %s)
+    ON CONFLICT (id) DO UPDATE SET shift = EXCLUDED.shift
+"""
+
+REBUILD_SQL = f"""
+    INSERT INTO {SCORES} (recipe_id, score)
+    SELECT recipe.id, COALESCE(delta.score, 0)
+    FROM {RECIPES} recipe
+    LEFT JOIN ({DELTA_SQL.format(events=ALL_EVENTS_SQL)}) AS delta
+        ON delta.recipe_id = recipe.id
+    ON CONFLICT (recipe_id) DO UPDATE SET score = EXCLUDED.score
+"""
+
+
+def current_period():
+    """Число целых периодов полураспада от TRENDING_ORIGIN до сейчас."""
+    return int(
+        (time.time() - TRENDING_ORIGIN) // settings.TRENDING_HALF_LIFE
+    )
+
+
+def current_shift():
+    return TrendingBase.objects.values_list('shift', flat=True).get(pk=1)
+
+
+def rescale(score, shift, current):
+    """Значение, записанное при базе shift, в базе current.
+
+    Совпадает с тем, что renormalize делает со значением в таблице.
+    """
+    return math.ldexp(score, shift - current)
+
+
+def _params(model, **params):
+    return {
+        'origin': TRENDING_ORIGIN,
+        'half_life': settings.TRENDING_HALF_LIFE,
+        'weight': WEIGHTS[model],
+        **params,
+    }
+
+
+def _apply(sql, events, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock_shared(%(lock)s); '
+            + sql.format(events=events),
+            {'lock': TRENDING_LOCK, **params},
+        )
+    bump_versions('trending')
+
+
+def add_recent(model, recipe_ids):
+    """Вклад строк model, добавленных в текущей транзакции."""
+    _apply(ADD_SQL, RECENT_EVENTS_SQL, _params(
+        model, recipes=list(recipe_ids)
+    ))
+
+
+def add_events(model, events):
+    """Вклад строк model по парам (recipe_id, created)."""
+    recipes, created = zip(*events) if events else ((), ())
+    _apply(ADD_SQL, EVENTS_SQL, _params(
+        model, recipes=list(recipes), created=list(created)
+    ))
+
+
+def remove_events(model, events):
+    recipes, created = zip(*events) if events else ((), ())
+    _apply(SUBTRACT_SQL, EVENTS_SQL, _params(
+        model, recipes=list(recipes), created=list(created)
+    ))
+
+
+def create_score(recipe_id):
+    TrendingScore.objects.bulk_create(
+        [TrendingScore(recipe_id=recipe_id)], ignore_conflicts=True
+    )
+
+
+@transaction.atomic
+def renormalize():
+    """Переносит базу к текущему периоду; возвращает число периодов."""
+    target = current_period()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [TRENDING_LOCK])
+        steps = target - current_shift()
+        if steps <= 0:
+            return 0
+        cursor.execute(SET_BASE_SQL, [target])
+        cursor.execute(
+            f'UPDATE {SCORES} SET score = score * %s WHERE score > 0',
+            [math.ldexp(1.0, -steps)],
+        )
+    return steps
+
+
+@transaction.atomic
+def rebuild():
+    """Пересчитывает все значения по избранному и корзинам."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [TRENDING_LOCK])
+        cursor.execute(SET_BASE_SQL, [current_period()])
+        cursor.execute(REBUILD_SQL, {
+            'origin': TRENDING_ORIGIN,
+            'half_life': settings.TRENDING_HALF_LIFE,
+            'favorite': WEIGHTS[Favorite],
+            'cart': WEIGHTS[ShoppingCart],
+        })
+    bump_versions('trending')
@@ -0,0 +1,80 @@
+"""Сборка вариантов изображений рецептов и аватаров.
+
+Строки без актуальных вариантов выбираются по частичным индексам
+recipe_image_variants_idx и user_avatar_variants_idx, файлы
+рендерятся в пуле процессов, а запись вариантов сохраняется, только
+если изображение не сменилось за время рендера. Варианты прежнего
+изображения уходят в очередь recipes.media.
+"""
+from itertools import repeat
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.cache import bump_cards, bump_versions
+from recipes.images import outdated, render, variant_names
+from recipes.media import queue_files
+from recipes.models import Recipe
+from users.models import User
+
+# Модель: (поле изображения, поле вариантов, ширины).
+TARGETS = {
+    Recipe: ('image', 'image_variants', settings.RECIPE_IMAGE_WIDTHS),
+    User: ('avatar', 'avatar_variants', settings.AVATAR_IMAGE_WIDTHS),
+}
+
+
+def pending(model, after_id, limit):
+    """(id, путь изображения, варианты) строк без актуальных вариантов."""
+    field, variants_field, _ = TARGETS[model]
+    return list(
+        model.objects.filter(outdated(field, variants_field))
+        .filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', field, variants_field)[:limit]
+    )
+
+
+@transaction.atomic
+def save_variants(model, rows, built):
+    """Записывает собранные варианты; возвращает id обновлённых строк."""
+    field, variants_field, _ = TARGETS[model]
+    updated = []
+    stale = []
+    for (pk, name, old), variants in zip(rows, built):
+        if model.objects.filter(pk=pk, **{field: name}).update(
+            **{variants_field: variants}
+        ):
+            updated.append(pk)
+            stale += variant_names(old)
+        else:
+            # Изображение заменили во время рендера.
+            stale += variant_names(variants)
+    queue_files(stale)
+    if model is Recipe and updated:
+        bump_cards(Recipe.objects.filter(id__in=updated))
+        bump_versions('recipes')
+    return updated
+
+
+def build(model, pool, batch_size, progress=None):
+    """Собирает варианты всех изображений model в пуле процессов pool.
+
+    progress вызывается с числом обработанных строк после каждого
+    пакета. Возвращает число обновлённых строк.
+    """
+    widths = TARGETS[model][2]
+    after_id = 0
+    done = 0
+    while True:
+        rows = pending(model, after_id, batch_size)
+        if not rows:
+            return done
+        # Рендер до транзакции записи.
+        built = list(pool.map(
+            render, [name for _, name, _ in rows], repeat(widths)
+        ))
+        done += len(save_variants(model, rows, built))
+        after_id = rows[-1][0]
+        if progress is not None:
+            progress(done)
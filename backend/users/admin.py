@@ -1,16 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from recipes.admin_tools import AutocompleteFilter, LargeTableAdminMixin
+from recipes.counters import change_counter
 from users.models import Subscription, User
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdminMixin, BaseUserAdmin):
     list_display = (
         'username',
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
         'is_staff',
     )
     search_fields = ('email', 'username', 'first_name', 'last_name')
@@ -19,7 +23,7 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'author')
     search_fields = (
         'user__username',
@@ -27,5 +31,27 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'author__username',
         'author__email',
     )
-    list_filter = ('user', 'author')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('author', AutocompleteFilter),
+    )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
     empty_value_display = '-пусто-'
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = Subscription.objects.get(pk=obj.pk)
+            change_counter('followers_count', [old.author_id], -1)
+        super().save_model(request, obj, form, change)
+        change_counter('followers_count', [obj.author_id], 1)
+
+    def delete_model(self, request, obj):
+        change_counter('followers_count', [obj.author_id], -1)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        change_counter('followers_count', list(
+            queryset.values_list('author', flat=True)
+        ), -1)
+        super().delete_queryset(request, queryset)
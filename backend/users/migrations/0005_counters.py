@@ -0,0 +1,43 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('users', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE users_user author
+                SET recipes_count = source.total
+                FROM (
+                    SELECT author_id, COUNT(*) AS total
+                    FROM recipes_recipe GROUP BY author_id
+                ) source
+                WHERE source.author_id = author.id;
+                UPDATE users_user author
+                SET followers_count = source.total
+                FROM (
+                    SELECT author_id, COUNT(*) AS total
+                    FROM users_subscription GROUP BY author_id
+                ) source
+                WHERE source.author_id = author.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
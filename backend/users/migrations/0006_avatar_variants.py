@@ -0,0 +1,24 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:54
+
+from django.db import migrations, models
+import django.db.models.fields.json
+import django.db.models.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Варианты аватара'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('avatar__isnull', False), models.Q(('avatar', ''), _negated=True), models.Q(django.db.models.lookups.IsNull(django.db.models.fields.json.KeyTextTransform('source', 'avatar_variants'), True), models.Q(django.db.models.lookups.Exact(django.db.models.fields.json.KeyTextTransform('source', 'avatar_variants'), models.F('avatar')), _negated=True), _connector='OR')), fields=['id'], name='user_avatar_variants_idx'),
+        ),
+    ]
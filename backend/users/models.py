@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 
+from recipes.images import outdated
+from recipes.managed import ManagedFieldsMixin
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
@@ -18,7 +21,7 @@ class UserManager(BaseUserManager):
         return self.create_user(email, username, password, **extra_fields)
 
 
-class User(AbstractUser):
+class User(ManagedFieldsMixin, AbstractUser):
     email = models.EmailField(
         max_length=254,
         unique=True,
@@ -40,6 +43,25 @@ class User(AbstractUser):
         null=True,
         verbose_name="Аватар",
     )
+    # Заполняется командой build_image_variants, см. recipes.images.
+    avatar_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Варианты аватара",
+    )
+    # Обновляются recipes.counters.
+    recipes_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Рецептов",
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Подписчиков",
+    )
+
+    managed_fields = ("avatar_variants", "recipes_count", "followers_count")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
@@ -50,6 +72,14 @@ class User(AbstractUser):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ["id"]
+        indexes = [
+            # Очередь build_image_variants; пуста, когда варианты собраны.
+            models.Index(
+                fields=["id"],
+                condition=outdated("avatar", "avatar_variants"),
+                name="user_avatar_variants_idx",
+            ),
+        ]
 
 
 class Subscription(models.Model):
@@ -58,12 +88,14 @@ class Subscription(models.Model):
         on_delete=models.CASCADE,
         related_name='followers',
         verbose_name='Подписчик',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='subscriptions',
         verbose_name='Автор',
+        db_index=False,
     )
 
     class Meta:
@@ -79,3 +111,11 @@ class Subscription(models.Model):
                 name='prevent_self_subscription'
             ),
         ]
+        indexes = [
+            # Подписчики автора; по user работает unique_subscription.
+            models.Index(
+                fields=['author'],
+                include=['user'],
+                name='subscription_author_user_idx',
+            ),
+        ]